@@ -0,0 +1,131 @@
+# autocomplete.py
+# In-memory prefix index over addresses that have already been resolved, ranked by how often they're used
+
+import heapq
+import logging
+from bisect import bisect_left, insort
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Query, GeocodeCacheEntry
+from utils import collapse_address, normalize_address
+from config import AUTOCOMPLETE_MAX_ENTRIES, AUTOCOMPLETE_MAX_SCAN, AUTOCOMPLETE_TOP_K
+
+logger = logging.getLogger("farfetchr.autocomplete")
+
+class AutocompleteIndex:
+    """Sorted array of canonical addresses (normalize_address keys) searched with bisect.
+
+    Each key carries a use count and a display form. Memory is bounded by `max_entries`:
+    on overflow the least-used tenth is dropped in one pass. Prefixes matching at most
+    `max_scan` keys are ranked directly; broader ones (short prefixes) are answered from a
+    per-prefix top `top_k` list, built by one full scan and kept current by add().
+    """
+
+    def __init__(self, max_entries: int = AUTOCOMPLETE_MAX_ENTRIES, max_scan: int = AUTOCOMPLETE_MAX_SCAN,
+                 top_k: int = AUTOCOMPLETE_TOP_K):
+        self.max_entries = max_entries
+        self.max_scan = max_scan
+        self.top_k = top_k
+        self._keys: list[str] = []
+        # key -> [count, display]
+        self._entries: dict[str, list] = {}
+        # prefix -> its top_k keys in _rank order, only for prefixes matching more than max_scan keys
+        self._top: dict[str, list[str]] = {}
+        self.lookups = 0
+        self.pruned = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _rank(self, key: str) -> tuple[int, str]:
+        # Most used first, then alphabetical (the order heapq.nlargest keeps for ties)
+        return -self._entries[key][0], key
+
+    def add(self, address: str, count: int = 1):
+        key = normalize_address(address)
+        if not key:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [count, collapse_address(address)]
+            insort(self._keys, key)
+            if len(self._keys) > self.max_entries:
+                self._prune()
+                return
+        else:
+            entry[0] += count
+            if entry[1] == key:
+                # Prefer the way a user typed it over a lower-cased cache key
+                entry[1] = collapse_address(address)
+        if self._top:
+            self._update_top(key)
+
+    def _update_top(self, key: str):
+        # Counts only grow between prunes, so each cached list stays exact with one insert
+        rank = self._rank(key)
+        for end in range(1, len(key) + 1):
+            top = self._top.get(key[:end])
+            if top is None:
+                continue
+            if key in top:
+                top.remove(key)
+            elif len(top) >= self.top_k and self._rank(top[-1]) < rank:
+                continue
+            insort(top, key, key=self._rank)
+            del top[self.top_k:]
+
+    def _prune(self):
+        keep = max(1, self.max_entries * 9 // 10)
+        ranked = heapq.nlargest(keep, self._entries.items(), key=lambda item: item[1][0])
+        self.pruned += len(self._entries) - len(ranked)
+        self._entries = dict(ranked)
+        self._keys = sorted(self._entries)
+        self._top.clear()
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[tuple[str, int]]:
+        """Most-used addresses starting with `prefix` (after normalization), as (address, count)."""
+        self.lookups += 1
+        key = normalize_address(prefix)
+        if not key:
+            return []
+        start = bisect_left(self._keys, key)
+        end = bisect_left(self._keys, key + "\uffff")
+        entries = self._entries
+        if end - start <= self.max_scan or limit > self.top_k:
+            best = heapq.nlargest(limit, self._keys[start:end], key=lambda k: entries[k][0])
+        else:
+            top = self._top.get(key)
+            if top is None:
+                top = self._top[key] = heapq.nsmallest(self.top_k, self._keys[start:end], key=self._rank)
+            best = top[:limit]
+        return [(entries[k][1], entries[k][0]) for k in best]
+
+    def clear(self):
+        self._keys.clear()
+        self._entries.clear()
+        self._top.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._keys), "max_entries": self.max_entries, "lookups": self.lookups,
+                "pruned": self.pruned, "cached_prefixes": len(self._top)}
+
+autocomplete_index = AutocompleteIndex()
+
+async def load_autocomplete(db: AsyncSession, limit: int = AUTOCOMPLETE_MAX_ENTRIES) -> int:
+    """Rebuild the index from stored queries (counted per address) and positive geocode cache rows."""
+    autocomplete_index.clear()
+    for column in (Query.source, Query.destination):
+        uses = func.count().label("uses")
+        result = await db.execute(select(column, uses).group_by(column).order_by(uses.desc()).limit(limit))
+        for address, count in result.all():
+            autocomplete_index.add(address, count)
+    # Resolved but never queried successfully (e.g. the other side failed): known, unranked
+    result = await db.execute(
+        select(GeocodeCacheEntry.address_key).where(GeocodeCacheEntry.found.is_(True)).limit(limit)
+    )
+    for (key,) in result.all():
+        autocomplete_index.add(key, 0)
+    return len(autocomplete_index)
@@ -0,0 +1,80 @@
+# backfill_coordinates.py
+# Fill in coordinates and geohashes for queries stored before they were recorded
+#
+#   python backfill_coordinates.py [--batch-size 500] [--max-rows N] [--concurrency 4]
+#
+# Addresses resolve through the geocode cache tiers first, so most rows never reach the geocoder.
+# Rows whose addresses no longer resolve are left as they are; /history/nearby skips them.
+
+import time
+import asyncio
+import argparse
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.future import select
+
+from models import Query
+from utils import query_coordinates
+from geocache import geocode_many
+from database import AsyncSessionLocal
+from http_client import start_http_client, close_http_client
+from init_db import init_models
+from config import BATCH_GEOCODE_CONCURRENCY
+
+async def backfill_coordinates(session_factory, batch_size: int = 500, max_rows: Optional[int] = None,
+                               concurrency: int = BATCH_GEOCODE_CONCURRENCY) -> tuple[int, int]:
+    """Keyset pass over rows without coordinates; returns (updated, skipped)."""
+    updated = skipped = 0
+    last_id = 0
+    while max_rows is None or updated + skipped < max_rows:
+        size = batch_size if max_rows is None else min(batch_size, max_rows - updated - skipped)
+        async with session_factory() as db:
+            rows = (await db.execute(
+                select(Query.id, Query.source, Query.destination)
+                .where(Query.src_geohash.is_(None), Query.id > last_id)
+                .order_by(Query.id)
+                .limit(size)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            addresses = list({address for _, source, destination in rows for address in (source, destination)})
+            results = await geocode_many(addresses, db, concurrency=concurrency)
+            resolved = {
+                address: result for address, result in zip(addresses, results)
+                if not isinstance(result, BaseException)
+            }
+            values = [
+                {"id": query_id, **query_coordinates(resolved[source], resolved[destination])}
+                for query_id, source, destination in rows
+                if source in resolved and destination in resolved
+            ]
+            if values:
+                # Bulk UPDATE by primary key, one executemany per batch
+                await db.execute(update(Query), values)
+                await db.commit()
+            updated += len(values)
+            skipped += len(rows) - len(values)
+    return updated, skipped
+
+async def main(args):
+    # Adds the coordinate columns and geohash indexes to older databases
+    await init_models()
+    await start_http_client()
+    try:
+        start = time.perf_counter()
+        updated, skipped = await backfill_coordinates(
+            AsyncSessionLocal, batch_size=args.batch_size, max_rows=args.max_rows, concurrency=args.concurrency
+        )
+        print(f"Backfilled {updated} queries ({skipped} skipped) in {time.perf_counter() - start:.2f}s")
+    finally:
+        await close_http_client()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill query coordinates and geohashes")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-rows", type=int, default=None, help="Stop after this many rows (default: all)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_GEOCODE_CONCURRENCY,
+                        help="Upstream geocoder lookups in flight at once")
+    asyncio.run(main(parser.parse_args()))
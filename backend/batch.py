@@ -0,0 +1,88 @@
+# batch.py
+# Streaming batch distance calculation for the /distance/batch endpoint
+
+import logging
+from datetime import datetime
+from typing import AsyncIterator, List
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Query
+from schemas import DistanceRequest, BatchDistanceItem
+from utils import haversine_vec, query_coordinates
+from geocache import geocode_many
+from autocomplete import autocomplete_index
+from config import BATCH_CHUNK_SIZE, BATCH_GEOCODE_CONCURRENCY
+
+logger = logging.getLogger("farfetchr.batch")
+
+def _line(item: BatchDistanceItem) -> bytes:
+    return (item.model_dump_json(exclude_none=True) + "\n").encode()
+
+async def stream_batch(pairs: List[DistanceRequest], session_factory,
+                       chunk_size: int = BATCH_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield one NDJSON line per pair, in input order, processing `chunk_size` pairs at a time.
+
+    Each chunk geocodes its unique addresses once, computes all distances in one vectorized
+    haversine call and stores the successful pairs with a single bulk insert.
+    """
+    for offset in range(0, len(pairs), chunk_size):
+        chunk = pairs[offset:offset + chunk_size]
+        async with session_factory() as db:
+            addresses = list(dict.fromkeys(a for p in chunk for a in (p.source, p.destination)))
+            resolved = dict(zip(addresses, await geocode_many(addresses, db, concurrency=BATCH_GEOCODE_CONCURRENCY)))
+
+            errors = {}
+            ok = []
+            for i, pair in enumerate(chunk):
+                failed = [r for r in (resolved[pair.source], resolved[pair.destination]) if isinstance(r, BaseException)]
+                if failed:
+                    errors[i] = str(failed[0])
+                else:
+                    ok.append(i)
+
+            now = datetime.utcnow()
+            miles = kilometers = np.empty(0)
+            if ok:
+                coords = np.array(
+                    [(*resolved[chunk[i].source], *resolved[chunk[i].destination]) for i in ok],
+                    dtype=np.float64,
+                )
+                miles, kilometers = haversine_vec(coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3])
+                rows = [
+                    {
+                        "source": chunk[i].source,
+                        "destination": chunk[i].destination,
+                        "miles": float(m),
+                        "kilometers": float(k),
+                        "timestamp": now,
+                        **query_coordinates(resolved[chunk[i].source], resolved[chunk[i].destination]),
+                    }
+                    for i, m, k in zip(ok, miles, kilometers)
+                ]
+                try:
+                    await db.execute(insert(Query), rows)
+                    await db.commit()
+                except SQLAlchemyError as e:
+                    await db.rollback()
+                    logger.error(f"Database error on batch chunk at offset {offset}: {e}")
+                    for i in ok:
+                        errors[i] = "Database error"
+                else:
+                    for row in rows:
+                        autocomplete_index.add(row["source"])
+                        autocomplete_index.add(row["destination"])
+
+        distances = {i: (float(m), float(k)) for i, m, k in zip(ok, miles, kilometers)}
+        for i, pair in enumerate(chunk):
+            if i in errors:
+                item = BatchDistanceItem(index=offset + i, source=pair.source, destination=pair.destination,
+                                         error=errors[i])
+            else:
+                m, k = distances[i]
+                item = BatchDistanceItem(index=offset + i, source=pair.source, destination=pair.destination,
+                                         miles=m, kilometers=k, timestamp=now)
+            yield _line(item)
+        logger.info(f"Batch chunk at offset {offset}: {len(chunk) - len(errors)} ok, {len(errors)} failed")
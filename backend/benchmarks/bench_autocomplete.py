@@ -0,0 +1,48 @@
+# bench_autocomplete.py
+# Measure AutocompleteIndex lookup and insert latency at its configured size.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_autocomplete.py --entries 50000
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from autocomplete import AutocompleteIndex  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the autocomplete prefix index")
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    streets = ("Main St", "Oak Ave", "Mission St", "Market St", "Broadway", "Elm St", "Lake Blvd")
+    addresses = [f"{rng.randint(1, 9999)} {rng.choice(streets)}, City {rng.randint(1, 500)}, CA"
+                 for _ in range(args.entries)]
+    index = AutocompleteIndex(max_entries=args.entries)
+    start = time.perf_counter()
+    for address in addresses:
+        index.add(address, count=rng.randint(1, 50))
+    insert = (time.perf_counter() - start) / len(addresses)
+
+    # Every keystroke of a sample of addresses, from 2 characters up
+    prefixes = [a[:n] for a in rng.sample(addresses, 200) for n in range(2, len(a) + 1)]
+    prefixes = (prefixes * (args.lookups // len(prefixes) + 1))[:args.lookups]
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        index.suggest(prefix, 8)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    print(f"{len(index)} entries, insert {insert * 1e6:.1f} us avg")
+    for label, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        print(f"suggest {label}: {timings[int(q * (len(timings) - 1))] * 1e6:8.1f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench_history_encoding.py
+# Compare /history serialization: QueryRead models + response_model + json vs. column rows + orjson.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_history_encoding.py --rows 10000 100000
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from schemas import QueryHistoryList, QueryRead  # noqa: E402
+from history import HISTORY_COLUMNS, history_items  # noqa: E402
+from encoding import dumps, compress, brotli, orjson  # noqa: E402
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def make_rows(count: int) -> list[tuple]:
+    base = datetime(2024, 1, 1)
+    return [
+        (i, f"{i} Market St, San Francisco, CA", f"{i % 97} Broadway, Oakland, CA",
+         i * 0.137, i * 0.137 * 1.609344, base + timedelta(seconds=i))
+        for i in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /history response encoding")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(QueryHistoryList)
+    print(f"orjson={'yes' if orjson else 'no'} brotli={'yes' if brotli else 'no'}")
+    for count in args.rows:
+        rows = make_rows(count)
+        # What the ORM path hands the endpoint: one attribute object per row
+        entities = [SimpleNamespace(**dict(zip(HISTORY_COLUMNS, row))) for row in rows]
+
+        def model_path():
+            # Endpoint builds models, FastAPI re-validates against response_model, then json.dumps
+            content = QueryHistoryList(
+                history=[QueryRead.model_validate(q, from_attributes=True) for q in entities], next_cursor=None
+            )
+            value = adapter.dump_python(adapter.validate_python(content), mode="json")
+            return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+        def fast_path():
+            return dumps({"history": history_items(rows), "next_cursor": None})
+
+        slow, slow_body = best_of(model_path, args.repeat)
+        fast, fast_body = best_of(fast_path, args.repeat)
+        assert json.loads(slow_body) == json.loads(fast_body)
+
+        print(f"{count} rows, {len(fast_body) / 1e6:.1f} MB JSON")
+        print(f"  {'models + response_model + json':<32} {slow * 1000:9.1f} ms")
+        print(f"  {'rows + orjson':<32} {fast * 1000:9.1f} ms  x{slow / fast:5.1f}")
+        for encoding in ("gzip", "br") if brotli else ("gzip",):
+            seconds, body = best_of(lambda: compress(fast_body, encoding), args.repeat)
+            print(f"  {encoding + ' (' + str(len(body) // 1024) + ' KB)':<32} {seconds * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+    main()
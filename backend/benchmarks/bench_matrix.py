@@ -0,0 +1,55 @@
+# bench_matrix.py
+# Compare utils.haversine_matrix against looping over the scalar utils.haversine.
+#
+# Usage (from the backend directory):
+#   python benchmarks/bench_matrix.py --origins 300 --destinations 3000
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import haversine, haversine_matrix  # noqa: E402
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized distance matrix kernel")
+    parser.add_argument("--origins", type=int, default=300)
+    parser.add_argument("--destinations", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    lat1, lon1 = rng.uniform(-90, 90, args.origins), rng.uniform(-180, 180, args.origins)
+    lat2, lon2 = rng.uniform(-90, 90, args.destinations), rng.uniform(-180, 180, args.destinations)
+    cells = args.origins * args.destinations
+
+    def scalar_loop():
+        dests = list(zip(lat2.tolist(), lon2.tolist()))
+        return [[haversine(a, b, c, d) for c, d in dests] for a, b in zip(lat1.tolist(), lon1.tolist())]
+
+    scalar = best_of(scalar_loop, 1)
+    vec64 = best_of(lambda: haversine_matrix(lat1, lon1, lat2, lon2), args.repeat)
+    vec32 = best_of(lambda: haversine_matrix(lat1, lon1, lat2, lon2, dtype=np.float32), args.repeat)
+
+    # Sanity check against the scalar implementation
+    _, km = haversine_matrix(lat1, lon1, lat2, lon2)
+    assert abs(km[0, 0] - haversine(lat1[0], lon1[0], lat2[0], lon2[0])[1]) < 1e-6
+
+    print(f"{args.origins} x {args.destinations} = {cells} cells")
+    for label, seconds in (("scalar haversine loop", scalar), ("haversine_matrix f64", vec64), ("haversine_matrix f32", vec32)):
+        print(f"{label:<24} {seconds * 1000:10.2f} ms  {cells / seconds / 1e6:8.2f} Mcells/s  x{scalar / seconds:7.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# fake_nominatim.py
+# Local Nominatim stand-in for benchmarks: deterministic coordinates, injectable latency, 5xx and 429.
+#
+# Usage (from the backend directory):
+#   python benchmarks/fake_nominatim.py --port 8089 --latency 0.05 --error-rate 0.01 --rate-429 0.01
+#   NOMINATIM_URL=http://127.0.0.1:8089/search uvicorn main:app
+
+import asyncio
+import random
+import hashlib
+import argparse
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Query as QueryParam
+from fastapi.responses import JSONResponse
+
+def coordinates_for(query: str) -> tuple[float, float]:
+    # Stable per address, spread over the continental US so distances look realistic
+    digest = hashlib.sha256(query.strip().lower().encode()).digest()
+    lat = 25.0 + int.from_bytes(digest[:4], "big") / 2**32 * 24.0
+    lon = -124.0 + int.from_bytes(digest[4:8], "big") / 2**32 * 57.0
+    return round(lat, 6), round(lon, 6)
+
+class FakeNominatim:
+    """Serves /search like Nominatim (format=json, limit=1) and counts what it was asked."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_429: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.reset()
+        self.app = self._build_app()
+
+    def reset(self):
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors, "throttled": self.throttled}
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/search")
+        async def search(q: str = QueryParam(...)):
+            self.calls += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+            if delay:
+                await asyncio.sleep(delay)
+            roll = self.random.random()
+            if roll < self.rate_429:
+                self.throttled += 1
+                return JSONResponse([], status_code=429, headers={"Retry-After": str(self.retry_after)})
+            if roll < self.rate_429 + self.error_rate:
+                self.errors += 1
+                return JSONResponse({"error": "injected"}, status_code=503)
+            lat, lon = coordinates_for(q)
+            return [{
+                "lat": str(lat),
+                "lon": str(lon),
+                "display_name": q,
+                "type": "house",
+                "importance": 0.5,
+            }]
+
+        @app.get("/_stats")
+        async def get_stats():
+            return self.stats()
+
+        @app.post("/_reset")
+        async def post_reset():
+            self.reset()
+            return self.stats()
+
+        return app
+
+class FakeNominatimServer:
+    """Runs a FakeNominatim on its own thread and event loop, so its latency does not
+    share a loop with the code under test."""
+
+    def __init__(self, fake: FakeNominatim, host: str = "127.0.0.1", port: int = 8089):
+        self.fake = fake
+        self.url = f"http://{host}:{port}/search"
+        self._server = uvicorn.Server(uvicorn.Config(fake.app, host=host, port=port, log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self, timeout: float = 10.0):
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"Fake Nominatim failed to start on {self.url}")
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Nominatim stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeNominatim(args.latency, args.jitter, args.error_rate, args.rate_429, args.retry_after, args.seed)
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
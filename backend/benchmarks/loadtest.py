@@ -0,0 +1,258 @@
+# loadtest.py
+# Drive /distance, /history and /distance/batch at fixed concurrency against a local Nominatim
+# stand-in, and write throughput, tail latency and upstream-call counts to a JSON file.
+#
+# Usage (from the backend directory):
+#   python benchmarks/loadtest.py --output results.json
+#   python benchmarks/loadtest.py --database-url postgresql+asyncpg://user:pw@localhost/farfetchr \
+#       --latency 0.1 --error-rate 0.02 --rate-429 0.01 --concurrency 64 --output pg.json
+#   python benchmarks/loadtest.py --compare base.json --output head.json
+#
+# The app runs in-process (lifespan included) behind httpx's ASGI transport unless --target
+# points at a running server, which must then be started with NOMINATIM_URL set to the fake's
+# URL (see fake_nominatim.py). Scenarios run in the given order and share the geocode cache.
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fake_nominatim import FakeNominatim, FakeNominatimServer  # noqa: E402
+
+SCENARIOS = ("distance", "history", "batch")
+
+def make_addresses(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    streets = ("Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Cedar Ln", "Elm St", "Lake Blvd")
+    return [f"{rng.randint(1, 9999)} {rng.choice(streets)}, Benchtown {i}, CA" for i in range(count)]
+
+def request_factory(scenario: str, addresses: list[str], batch_size: int, seed: int):
+    """Return a function mapping a request number to (method, path, kwargs), deterministically."""
+    rng = random.Random(seed)
+
+    def distance(_):
+        source, destination = rng.sample(addresses, 2)
+        return "POST", "/distance", {"json": {"source": source, "destination": destination}}
+
+    def history(i):
+        params = {"limit": 50}
+        if i % 2:
+            # Every other request filters, exercising the trigram/ilike path
+            params["address"] = rng.choice(addresses).split(",")[1].strip()
+        return "GET", "/history", {"params": params}
+
+    def batch(_):
+        pairs = [dict(zip(("source", "destination"), rng.sample(addresses, 2))) for _ in range(batch_size)]
+        return "POST", "/distance/batch", {"json": {"pairs": pairs}}
+
+    return {"distance": distance, "history": history, "batch": batch}[scenario]
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, make_request, total: int, concurrency: int,
+                       fake: FakeNominatim) -> dict:
+    latencies = []
+    statuses = Counter()
+    numbers = iter(range(total))
+
+    async def worker():
+        # Workers share one iterator, so exactly `total` requests are sent
+        for i in numbers:
+            method, path, kwargs = make_request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    fake.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "scenario": scenario,
+        "requests": total,
+        "concurrency": concurrency,
+        "duration_s": round(duration, 4),
+        "rps": round(total / duration, 2),
+        "latency_ms": {
+            "p50": round(p50, 3),
+            "p95": round(p95, 3),
+            "p99": round(p99, 3),
+            "mean": round(float(np.mean(latencies)) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+        "status": dict(sorted(statuses.items())),
+        "upstream": fake.stats(),
+    }
+
+async def seed_history(rows: int, addresses: list[str], seed: int):
+    """Create the schema and insert `rows` Query rows so /history has something to page through."""
+    from sqlalchemy import insert, delete
+    from database import AsyncSessionLocal
+    from init_db import init_models
+    from models import Query
+
+    await init_models()
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Query))
+        for offset in range(0, rows, 5000):
+            batch = []
+            for i in range(offset, min(rows, offset + 5000)):
+                miles = rng.uniform(1, 2500)
+                source, destination = rng.sample(addresses, 2)
+                batch.append(dict(source=source, destination=destination, miles=miles,
+                                  kilometers=miles * 1.609344, timestamp=now - timedelta(seconds=i)))
+            await db.execute(insert(Query), batch)
+        await db.commit()
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(results: list[dict], baseline: dict | None):
+    previous = {r["scenario"]: r for r in (baseline or {}).get("scenarios", [])}
+    print(f"{'scenario':<10} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'upstream':>9}  status")
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{r['scenario']:<10} {r['rps']:>10.1f} {lat['p50']:>9.2f} {lat['p95']:>9.2f} {lat['p99']:>9.2f} "
+              f"{r['upstream']['calls']:>9}  {r['status']}")
+        old = previous.get(r["scenario"])
+        if old:
+            def change(new, before):
+                return f"{(new - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{'  vs base':<10} {change(r['rps'], old['rps']):>10} "
+                  f"{change(lat['p50'], old['latency_ms']['p50']):>9} {change(lat['p95'], old['latency_ms']['p95']):>9} "
+                  f"{change(lat['p99'], old['latency_ms']['p99']):>9} {change(r['upstream']['calls'], old['upstream']['calls']):>9}")
+
+async def run(args, fake: FakeNominatim) -> list[dict]:
+    addresses = make_addresses(args.addresses, args.seed)
+    if args.target:
+        client = httpx.AsyncClient(base_url=args.target, timeout=60)
+        lifespan = None
+    else:
+        # Config is read at import time, so the app is imported only after the environment is set
+        from main import app
+        await seed_history(args.history_rows, addresses, args.seed)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+    results = []
+    try:
+        for scenario in args.scenarios:
+            total = args.batch_requests if scenario == "batch" else args.requests
+            make_request = request_factory(scenario, addresses, args.batch_size, args.seed)
+            result = await run_scenario(client, scenario, make_request, total, args.concurrency, fake)
+            if scenario == "batch":
+                result["pairs_per_s"] = round(result["rps"] * args.batch_size, 2)
+            results.append(result)
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            from database import engine
+            await lifespan.__aexit__(None, None, None)
+            await engine.dispose()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the FarFetchr API against a fake Nominatim")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda value: [s.strip() for s in value.split(",") if s.strip()],
+                        help="comma-separated, run in order: distance,history,batch")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per distance/history scenario")
+    parser.add_argument("--batch-requests", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100, help="pairs per batch request")
+    parser.add_argument("--addresses", type=int, default=500, help="size of the address pool (controls cache hit rate)")
+    parser.add_argument("--history-rows", type=int, default=20000, help="rows seeded before the run (in-process only)")
+    parser.add_argument("--database-url", default=None,
+                        help="SQLAlchemy async URL; defaults to a fresh SQLite file in a temp directory")
+    parser.add_argument("--target", default=None, help="base URL of a running server instead of the in-process app")
+    parser.add_argument("--write-mode", choices=("sync", "write_behind"), default="sync")
+    parser.add_argument("--upstream-rate", type=float, default=0.0,
+                        help="NOMINATIM_RATE_LIMIT for the app; 0 disables the governor")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Nominatim latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake 503 responses")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of fake 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--fake-port", type=int, default=8089)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="loadtest-results.json")
+    parser.add_argument("--compare", default=None, help="earlier results file to print deltas against")
+    parser.add_argument("--log-level", default="CRITICAL", help="level for the app's farfetchr.* loggers")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    fake = FakeNominatim(args.latency, args.jitter, args.error_rate, args.rate_429, args.retry_after, args.seed)
+    server = FakeNominatimServer(fake, port=args.fake_port)
+    server.start()
+
+    tmpdir = None
+    database_url = args.database_url
+    if database_url is None and not args.target:
+        tmpdir = tempfile.TemporaryDirectory(prefix="farfetchr-bench-")
+        database_url = f"sqlite+aiosqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    if not args.target:
+        os.environ.update({
+            "DATABASE_URL": database_url,
+            "NOMINATIM_URL": server.url,
+            "NOMINATIM_RATE_LIMIT": str(args.upstream_rate),
+            "GEOCODER_BACKENDS": "nominatim",
+            "QUERY_WRITE_MODE": args.write_mode,
+            "RATE_LIMIT": "1000000/minute",
+        })
+    logging.getLogger("farfetchr").setLevel(args.log_level)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    try:
+        results = asyncio.run(run(args, fake))
+    finally:
+        server.stop()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": database_url.split(":", 1)[0] if database_url else None,
+        "target": args.target or "in-process",
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("database_url", "output", "compare", "target")},
+        "scenarios": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
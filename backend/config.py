@@ -5,7 +5,90 @@ RATE_LIMIT = os.getenv("RATE_LIMIT", "50/minute")
 
 # Retry settings for geocoding
 GEOCODE_MAX_RETRIES = int(os.getenv("GEOCODE_MAX_RETRIES", 3))
-GEOCODE_RETRY_DELAY = float(os.getenv("GEOCODE_RETRY_DELAY", 1.0))  # seconds
+GEOCODE_RETRY_DELAY = float(os.getenv("GEOCODE_RETRY_DELAY", 1.0))  # seconds, base of the exponential backoff
 
 # Nominatim API URL
-NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search") 
\ No newline at end of file
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+
+# Geocode cache settings
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 10000))  # in-process LRU entries
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", 86400))  # seconds
+GEOCODE_CACHE_NEGATIVE_TTL = float(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", 3600))  # seconds
+GEOCODE_CACHE_DB_TTL = float(os.getenv("GEOCODE_CACHE_DB_TTL", 30 * 86400))  # seconds
+GEOCODE_CACHE_WARM_LIMIT = int(os.getenv("GEOCODE_CACHE_WARM_LIMIT", 5000))  # rows loaded at startup
+GEOCODE_CACHE_PURGE_INTERVAL = float(os.getenv("GEOCODE_CACHE_PURGE_INTERVAL", 3600))  # seconds; 0 disables
+
+# Shared Nominatim HTTP client (connection pool) settings
+NOMINATIM_MAX_CONNECTIONS = int(os.getenv("NOMINATIM_MAX_CONNECTIONS", 20))
+NOMINATIM_MAX_KEEPALIVE = int(os.getenv("NOMINATIM_MAX_KEEPALIVE", 10))
+NOMINATIM_KEEPALIVE_EXPIRY = float(os.getenv("NOMINATIM_KEEPALIVE_EXPIRY", 30.0))  # seconds
+NOMINATIM_HTTP2 = os.getenv("NOMINATIM_HTTP2", "false").lower() == "true"  # needs the h2 package
+NOMINATIM_CONNECT_TIMEOUT = float(os.getenv("NOMINATIM_CONNECT_TIMEOUT", 5.0))  # seconds
+NOMINATIM_READ_TIMEOUT = float(os.getenv("NOMINATIM_READ_TIMEOUT", 10.0))  # seconds
+NOMINATIM_WRITE_TIMEOUT = float(os.getenv("NOMINATIM_WRITE_TIMEOUT", 5.0))  # seconds
+NOMINATIM_POOL_TIMEOUT = float(os.getenv("NOMINATIM_POOL_TIMEOUT", 5.0))  # seconds waiting for a free connection
+
+# Batch distance endpoint settings
+BATCH_MAX_PAIRS = int(os.getenv("BATCH_MAX_PAIRS", 10000))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 500))  # pairs geocoded, inserted and streamed together
+BATCH_GEOCODE_CONCURRENCY = int(os.getenv("BATCH_GEOCODE_CONCURRENCY", 8))  # parallel upstream lookups
+
+# Distance matrix endpoint settings
+MATRIX_MAX_POINTS = int(os.getenv("MATRIX_MAX_POINTS", 5000))  # per side (origins or destinations)
+MATRIX_MAX_CELLS = int(os.getenv("MATRIX_MAX_CELLS", 2_000_000))  # origins x destinations
+MATRIX_CHUNK_CELLS = int(os.getenv("MATRIX_CHUNK_CELLS", 262_144))  # cells computed per block
+
+# History pagination
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 50))  # default rows per /history page
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", 500))
+HISTORY_EXPORT_BATCH_SIZE = int(os.getenv("HISTORY_EXPORT_BATCH_SIZE", 1000))  # rows fetched per server-side cursor batch
+
+# Query persistence mode: "sync" commits each /distance row inline, "write_behind" queues rows
+# and flushes them in bulk from a background task
+QUERY_WRITE_MODE = os.getenv("QUERY_WRITE_MODE", "sync")
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", 10000))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500))  # flush when this many rows are queued
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 0.5))  # or after this many seconds
+WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT", 1.0))  # max wait for queue space
+WRITE_BEHIND_DRAIN_TIMEOUT = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", 10.0))  # max wait on shutdown
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", 5))  # extra attempts per failed flush
+WRITE_BEHIND_RETRY_DELAY = float(os.getenv("WRITE_BEHIND_RETRY_DELAY", 0.5))  # first retry delay, doubled each time
+WRITE_BEHIND_RETRY_MAX_DELAY = float(os.getenv("WRITE_BEHIND_RETRY_MAX_DELAY", 5.0))
+
+# Upstream (Nominatim) retry policy
+GEOCODE_RETRY_MAX_DELAY = float(os.getenv("GEOCODE_RETRY_MAX_DELAY", 30.0))  # cap for backoff and Retry-After, seconds
+NOMINATIM_RATE_LIMIT = float(os.getenv("NOMINATIM_RATE_LIMIT", 1.0))  # requests/second per process, 0 disables
+NOMINATIM_RATE_BURST = int(os.getenv("NOMINATIM_RATE_BURST", 1))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))  # consecutive failures before opening
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30.0))  # seconds open before a trial request
+
+# Geocoder backends, tried in order; "local" is skipped unless LOCAL_GEOCODER_DB exists
+GEOCODER_BACKENDS = [b.strip() for b in os.getenv("GEOCODER_BACKENDS", "local,nominatim").split(",") if b.strip()]
+LOCAL_GEOCODER_DB = os.getenv("LOCAL_GEOCODER_DB", "")  # SQLite file built by geocoder_import.py
+LOCAL_GEOCODER_MIN_TOKENS = int(os.getenv("LOCAL_GEOCODER_MIN_TOKENS", 3))  # shortest query allowed to match by tokens
+
+# Logging: verbose output is opt-in so hot paths don't pay for it
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"  # log every SQL statement
+LOG_UPSTREAM_BODIES = os.getenv("LOG_UPSTREAM_BODIES", "false").lower() == "true"  # log every Nominatim body
+LOG_UPSTREAM_SAMPLE_RATE = float(os.getenv("LOG_UPSTREAM_SAMPLE_RATE", 0.0))  # else log this fraction of them
+
+# Multi-worker mode: state shared by all worker processes (rate-limit counters, geocode entries)
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "")  # sqlite:///path.db or redis://host:6379/0; empty = per process
+
+# Response encoding: large JSON bodies are compressed when the client accepts it
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))  # bytes; smaller bodies aren't worth compressing
+COMPRESS_MAX_SIZE = int(os.getenv("COMPRESS_MAX_SIZE", 8 * 1024 * 1024))  # bytes; larger bodies would stall the event loop
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))  # used only when the brotli package is installed
+
+# Address autocomplete (in-memory prefix index per process)
+AUTOCOMPLETE_MAX_ENTRIES = int(os.getenv("AUTOCOMPLETE_MAX_ENTRIES", 50000))  # distinct addresses kept
+AUTOCOMPLETE_MAX_SCAN = int(os.getenv("AUTOCOMPLETE_MAX_SCAN", 1000))  # broader prefixes use a cached top list
+AUTOCOMPLETE_TOP_K = int(os.getenv("AUTOCOMPLETE_TOP_K", 25))  # cached suggestions per broad prefix; max limit
+AUTOCOMPLETE_RATE_LIMIT = os.getenv("AUTOCOMPLETE_RATE_LIMIT", "600/minute")  # called on every keystroke
+
+# Stored coordinates and nearby search
+GEOHASH_PRECISION = int(os.getenv("GEOHASH_PRECISION", 9))  # characters stored per endpoint (~5 m cells)
+NEARBY_MAX_CELLS = int(os.getenv("NEARBY_MAX_CELLS", 16))  # geohash ranges scanned per side of a search
+NEARBY_MAX_RADIUS_MILES = float(os.getenv("NEARBY_MAX_RADIUS_MILES", 500.0))
+NEARBY_MAX_CANDIDATES = int(os.getenv("NEARBY_MAX_CANDIDATES", 100000))  # rows checked exactly before giving up
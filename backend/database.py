@@ -5,12 +5,13 @@ import os
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
+from config import SQL_ECHO
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, future=True)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -22,4 +23,8 @@ AsyncSessionLocal = sessionmaker(
 
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session 
\ No newline at end of file
+        yield session
+
+def get_sessionmaker():
+    # For endpoints that open sessions themselves, e.g. inside a streaming response
+    return AsyncSessionLocal
@@ -0,0 +1,75 @@
+# encoding.py
+# Fast JSON responses: orjson encoding (json fallback) and size-gated gzip/brotli compression
+
+import gzip
+import json
+from datetime import datetime
+
+import numpy as np
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from config import COMPRESS_MIN_SIZE, COMPRESS_MAX_SIZE, GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only gzip is offered
+    brotli = None
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(payload) -> bytes:
+    """Compact JSON; datetimes as ISO 8601, matching pydantic's output for naive timestamps.
+    numpy arrays are written as nested lists without going through Python floats."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Pick br (when brotli is installed) or gzip from an Accept-Encoding header."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def json_response(request: Request, payload, status_code: int = 200,
+                  min_size: int = COMPRESS_MIN_SIZE, max_size: int = COMPRESS_MAX_SIZE) -> Response:
+    """Encode `payload` directly, skipping response_model validation, and compress large bodies
+    (up to `max_size`: compressing tens of MB inline takes seconds)."""
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    if min_size <= len(body) <= max_size:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is not None:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,364 @@
+# geocache.py
+# Geocode cache for FarFetchr backend: in-process LRU, optional cross-worker shared store, geocode_cache table
+
+import json
+import time
+import asyncio
+import datetime
+import logging
+from collections import OrderedDict
+from functools import partial
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.future import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import GeocodeCacheEntry
+from utils import normalize_address, AddressNotFoundError
+from geocoders import geocode_address
+from singleflight import SingleFlight
+from upstream import UpstreamUnavailableError
+from metrics import GEOCODE_SECONDS
+from shared_state import shared_store, STORE_ERRORS
+from config import (
+    GEOCODE_CACHE_SIZE,
+    GEOCODE_CACHE_TTL,
+    GEOCODE_CACHE_NEGATIVE_TTL,
+    GEOCODE_CACHE_DB_TTL,
+    GEOCODE_CACHE_WARM_LIMIT,
+    GEOCODE_CACHE_PURGE_INTERVAL,
+)
+
+logger = logging.getLogger("farfetchr.geocache")
+
+# Sentinel for "no usable entry"; None is a valid (negative) cached value
+MISS = object()
+
+class GeocodeCache:
+    """Bounded LRU mapping normalized address -> (lat, lon), or None for a negative entry."""
+
+    def __init__(self, maxsize: int = GEOCODE_CACHE_SIZE, ttl: float = GEOCODE_CACHE_TTL,
+                 negative_ttl: float = GEOCODE_CACHE_NEGATIVE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[str, tuple[Optional[tuple[float, float]], float]]" = OrderedDict()
+        self.counters = {
+            "memory_hits": 0,
+            "shared_hits": 0,
+            "db_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "db_purged": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return MISS
+        value, expires = item
+        if expires <= time.monotonic():
+            del self._data[key]
+            self.counters["expirations"] += 1
+            return MISS
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Optional[tuple[float, float]], ttl: Optional[float] = None):
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        hits = self.counters["memory_hits"] + self.counters["shared_hits"] + self.counters["db_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+geocode_cache = GeocodeCache()
+# Coalesces concurrent upstream lookups of the same normalized address
+inflight = SingleFlight()
+
+def _unwrap(address: str, value: Optional[tuple[float, float]]):
+    if value is None:
+        return AddressNotFoundError(f"Address not found: {address}")
+    return value
+
+async def _load_entries(db: AsyncSession, keys: list[str]) -> dict:
+    """Fetch unexpired rows for `keys` in one query; returns key -> (value, remaining_seconds)."""
+    now = datetime.datetime.utcnow()
+    try:
+        result = await db.execute(
+            select(GeocodeCacheEntry).where(
+                GeocodeCacheEntry.address_key.in_(keys),
+                GeocodeCacheEntry.expires_at > now,
+            )
+        )
+        entries = result.scalars().all()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.warning(f"Geocode cache lookup failed for {len(keys)} keys: {e}")
+        return {}
+    return {
+        entry.address_key: (
+            (entry.lat, entry.lon) if entry.found else None,
+            (entry.expires_at - now).total_seconds(),
+        )
+        for entry in entries
+    }
+
+async def _load_stale_entries(db: AsyncSession, keys: list[str]) -> dict:
+    """Positive rows for `keys` regardless of expiry; served only while upstream is unavailable."""
+    try:
+        result = await db.execute(
+            select(GeocodeCacheEntry).where(
+                GeocodeCacheEntry.address_key.in_(keys),
+                GeocodeCacheEntry.found.is_(True),
+            )
+        )
+        return {entry.address_key: (entry.lat, entry.lon) for entry in result.scalars().all()}
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.warning(f"Geocode cache stale lookup failed for {len(keys)} keys: {e}")
+        return {}
+
+async def _store_entries(db: AsyncSession, values: dict):
+    """Upsert key -> (lat, lon) / None rows and commit once."""
+    now = datetime.datetime.utcnow()
+    rows = []
+    for key, value in values.items():
+        ttl = GEOCODE_CACHE_DB_TTL if value is not None else GEOCODE_CACHE_NEGATIVE_TTL
+        rows.append({
+            "address_key": key,
+            "lat": value[0] if value else None,
+            "lon": value[1] if value else None,
+            "found": value is not None,
+            "created_at": now,
+            "expires_at": now + datetime.timedelta(seconds=ttl),
+        })
+    try:
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = pg_insert if dialect == "postgresql" else sqlite_insert
+            stmt = insert(GeocodeCacheEntry).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[GeocodeCacheEntry.address_key],
+                set_={col: stmt.excluded[col] for col in ("lat", "lon", "found", "created_at", "expires_at")},
+            )
+            await db.execute(stmt)
+        else:
+            for row in rows:
+                await db.merge(GeocodeCacheEntry(**row))
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.warning(f"Geocode cache write failed for {len(rows)} keys: {e}")
+
+SHARED_PREFIX = "geocode:"
+
+# Store calls are blocking socket/SQLite I/O (up to the Redis timeout or the SQLite busy timeout),
+# so they run in a thread instead of stalling every request on this worker's event loop
+
+async def _load_shared(keys: list[str]) -> dict:
+    """Entries other workers have resolved; key -> (lat, lon) or None."""
+    try:
+        found = await asyncio.to_thread(shared_store.get_many, [SHARED_PREFIX + key for key in keys])
+    except STORE_ERRORS as e:
+        logger.warning(f"Shared geocode lookup failed for {len(keys)} keys: {e}")
+        return {}
+    return {key: json.loads(found[SHARED_PREFIX + key]) for key in keys if SHARED_PREFIX + key in found}
+
+async def _store_shared(values: dict):
+    positive = {SHARED_PREFIX + key: json.dumps(value).encode() for key, value in values.items() if value is not None}
+    negative = {SHARED_PREFIX + key: b"null" for key, value in values.items() if value is None}
+    try:
+        if positive:
+            await asyncio.to_thread(shared_store.set_many, positive, geocode_cache.ttl)
+        if negative:
+            await asyncio.to_thread(shared_store.set_many, negative, geocode_cache.negative_ttl)
+    except STORE_ERRORS as e:
+        logger.warning(f"Shared geocode write failed for {len(values)} keys: {e}")
+
+async def _fetch(address: str):
+    """One upstream lookup; returns coords, or None for a definitive 'not found'."""
+    try:
+        return await geocode_address(address)
+    except AddressNotFoundError:
+        return None
+
+async def geocode_many(addresses: list[str], db: Optional[AsyncSession] = None,
+                       concurrency: Optional[int] = None) -> list:
+    """Resolve addresses concurrently through the memory tier, the shared store (when
+    SHARED_STATE_URL is set), the DB tier and the geocoder backends.
+
+    Returns one entry per input address: a (lat, lon) tuple or the exception raised for it.
+    Duplicate addresses (after normalization) are looked up once, and concurrent callers
+    asking for the same address share a single upstream request. `concurrency` caps the
+    number of upstream lookups this call runs at once.
+    """
+    keys = [normalize_address(address) for address in addresses]
+    first_address = {}
+    for key, address in zip(keys, addresses):
+        first_address.setdefault(key, address)
+
+    resolved = {}
+    pending = []
+    start = time.perf_counter()
+    for key in first_address:
+        value = geocode_cache.get(key)
+        if value is MISS:
+            pending.append(key)
+        else:
+            geocode_cache.counters["memory_hits"] += 1
+            if value is None:
+                geocode_cache.counters["negative_hits"] += 1
+            resolved[key] = value
+    GEOCODE_SECONDS.observe(time.perf_counter() - start, "memory")
+
+    if pending and shared_store is not None:
+        with GEOCODE_SECONDS.time("shared"):
+            loaded = await _load_shared(pending)
+        for key, value in loaded.items():
+            geocode_cache.counters["shared_hits"] += 1
+            if value is None:
+                geocode_cache.counters["negative_hits"] += 1
+            value = tuple(value) if value is not None else None
+            geocode_cache.set(key, value)
+            resolved[key] = value
+        pending = [key for key in pending if key not in loaded]
+
+    if pending and db is not None:
+        with GEOCODE_SECONDS.time("db"):
+            loaded = await _load_entries(db, pending)
+        for key, (value, remaining) in loaded.items():
+            geocode_cache.counters["db_hits"] += 1
+            if value is None:
+                geocode_cache.counters["negative_hits"] += 1
+            default_ttl = geocode_cache.ttl if value is not None else geocode_cache.negative_ttl
+            geocode_cache.set(key, value, ttl=min(remaining, default_ttl))
+            resolved[key] = value
+        pending = [key for key in pending if key not in loaded]
+        if loaded and shared_store is not None:
+            await _store_shared({key: value for key, (value, _) in loaded.items()})
+
+    if pending:
+        geocode_cache.counters["misses"] += len(pending)
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def resolve(key):
+            if semaphore is None:
+                return await inflight.do(key, partial(_fetch, first_address[key]))
+            async with semaphore:
+                return await inflight.do(key, partial(_fetch, first_address[key]))
+
+        with GEOCODE_SECONDS.time("fetch"):
+            fetched = await asyncio.gather(*(resolve(key) for key in pending), return_exceptions=True)
+        to_store = {}
+        for key, value in zip(pending, fetched):
+            if isinstance(value, BaseException):
+                # Transient upstream failure: report it but cache nothing
+                resolved[key] = value
+                continue
+            geocode_cache.set(key, value)
+            to_store[key] = value
+            resolved[key] = value
+        if to_store and shared_store is not None:
+            await _store_shared(to_store)
+        if to_store and db is not None:
+            await _store_entries(db, to_store)
+        unavailable = [key for key in pending if isinstance(resolved[key], UpstreamUnavailableError)]
+        if unavailable and db is not None:
+            # Upstream is down (retries exhausted or circuit open): fall back to expired rows
+            for key, value in (await _load_stale_entries(db, unavailable)).items():
+                geocode_cache.counters["stale_hits"] += 1
+                resolved[key] = value
+
+    results = []
+    for key, address in zip(keys, addresses):
+        value = resolved[key]
+        results.append(value if isinstance(value, BaseException) else _unwrap(address, value))
+    return results
+
+async def geocode_cached(address: str, db: Optional[AsyncSession] = None) -> tuple[float, float]:
+    """Resolve a single address through the cache tiers; raises on failure."""
+    (result,) = await geocode_many([address], db)
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+async def purge_expired(db: AsyncSession) -> int:
+    """Delete expired rows from the geocode_cache table; returns the number removed."""
+    result = await db.execute(
+        delete(GeocodeCacheEntry).where(GeocodeCacheEntry.expires_at <= datetime.datetime.utcnow())
+    )
+    await db.commit()
+    purged = result.rowcount or 0
+    geocode_cache.counters["db_purged"] += purged
+    return purged
+
+_purge_task: Optional[asyncio.Task] = None
+
+async def _purge_periodically(session_factory, interval: float):
+    # Expired positive rows and negative entries would otherwise stay until the next restart
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as db:
+                purged = await purge_expired(db)
+            if purged:
+                logger.info(f"Purged {purged} expired geocode cache rows")
+        except Exception as e:
+            # Keep purging on the next tick, e.g. once the DB is back
+            logger.warning(f"Geocode cache purge failed: {e!r}")
+
+def start_cache_purger(session_factory, interval: float = GEOCODE_CACHE_PURGE_INTERVAL):
+    global _purge_task
+    if _purge_task is None and interval > 0:
+        _purge_task = asyncio.create_task(_purge_periodically(session_factory, interval))
+
+async def stop_cache_purger():
+    global _purge_task
+    if _purge_task is not None:
+        _purge_task.cancel()
+        try:
+            await _purge_task
+        except asyncio.CancelledError:
+            pass
+        _purge_task = None
+
+async def warm_cache(db: AsyncSession, limit: int = GEOCODE_CACHE_WARM_LIMIT) -> int:
+    """Load the most recent positive, unexpired rows into the in-process tier."""
+    now = datetime.datetime.utcnow()
+    result = await db.execute(
+        select(GeocodeCacheEntry)
+        .where(GeocodeCacheEntry.found.is_(True), GeocodeCacheEntry.expires_at > now)
+        .order_by(GeocodeCacheEntry.created_at.desc())
+        .limit(min(limit, geocode_cache.maxsize))
+    )
+    entries = result.scalars().all()
+    # Insert oldest first so the newest rows end up most-recently-used
+    for entry in reversed(entries):
+        remaining = (entry.expires_at - now).total_seconds()
+        geocode_cache.set(entry.address_key, (entry.lat, entry.lon), ttl=min(remaining, geocode_cache.ttl))
+    return len(entries)
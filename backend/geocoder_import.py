@@ -0,0 +1,33 @@
+# geocoder_import.py
+# Build or rebuild the offline gazetteer used by the local geocoder backend
+#
+#   python geocoder_import.py import addresses.csv --db gazetteer.db [--replace]
+#   python geocoder_import.py rebuild --db gazetteer.db
+
+import time
+import argparse
+from geocoders import read_gazetteer_csv, import_places, rebuild_index
+from config import LOCAL_GEOCODER_DB
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the FarFetchr offline gazetteer")
+    parser.add_argument("--db", default=LOCAL_GEOCODER_DB or "gazetteer.db", help="SQLite store (default: LOCAL_GEOCODER_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("import", help="Import a CSV extract (address,lat,lon or OSM addr:* columns)")
+    load.add_argument("csv", nargs="+")
+    load.add_argument("--replace", action="store_true", help="Drop existing places first")
+    commands.add_parser("rebuild", help="Rebuild and optimize the full-text index")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "import":
+        total = 0
+        for i, path in enumerate(args.csv):
+            total += import_places(args.db, read_gazetteer_csv(path), replace=args.replace and i == 0)
+        print(f"Imported {total} places into {args.db} in {time.perf_counter() - start:.2f}s")
+    else:
+        rebuild_index(args.db)
+        print(f"Rebuilt index for {args.db} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# geocoders.py
+# Pluggable geocoder backends behind geocode_address: an offline SQLite/FTS5 gazetteer and Nominatim
+
+import os
+import re
+import csv
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, Optional
+
+from utils import clean_address, geocode_nominatim, AddressNotFoundError
+from metrics import GEOCODE_SECONDS
+from config import GEOCODER_BACKENDS, LOCAL_GEOCODER_DB, LOCAL_GEOCODER_MIN_TOKENS
+
+logger = logging.getLogger("farfetchr.geocoders")
+
+class GeocoderBackend(ABC):
+    """A source of coordinates. geocode() returns (lat, lon), or None when the backend does not
+    know the address so the next backend is tried; it may raise to stop the chain."""
+
+    name = "base"
+
+    @abstractmethod
+    async def geocode(self, address: str) -> Optional[tuple[float, float]]:
+        ...
+
+    def stats(self) -> dict:
+        return {"name": self.name}
+
+class NominatimGeocoder(GeocoderBackend):
+    name = "nominatim"
+
+    async def geocode(self, address: str) -> Optional[tuple[float, float]]:
+        return await geocode_nominatim(address)
+
+# Street-type and direction abbreviations folded to one spelling, so "415 Mission St" and
+# "415 mission street" produce the same tokens
+ABBREVIATIONS = {
+    "st": "street", "str": "street", "ave": "avenue", "av": "avenue", "rd": "road",
+    "blvd": "boulevard", "dr": "drive", "ln": "lane", "ct": "court", "pl": "place",
+    "pkwy": "parkway", "hwy": "highway", "sq": "square", "ter": "terrace", "cir": "circle",
+    "n": "north", "s": "south", "e": "east", "w": "west",
+    "ne": "northeast", "nw": "northwest", "se": "southeast", "sw": "southwest",
+}
+
+def address_tokens(address: str) -> list[str]:
+    words = re.findall(r"[a-z0-9]+", clean_address(address).lower())
+    return [ABBREVIATIONS.get(word, word) for word in words]
+
+def normalize_tokens(address: str) -> str:
+    return " ".join(address_tokens(address))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    id INTEGER PRIMARY KEY,
+    address TEXT NOT NULL,
+    norm TEXT NOT NULL UNIQUE,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS places_fts USING fts5(
+    norm, content='places', content_rowid='id', tokenize='unicode61'
+);
+"""
+
+def read_gazetteer_csv(path: str) -> Iterator[tuple[str, float, float]]:
+    """Yield (address, lat, lon) from a CSV with either an `address` column or OSM-style
+    addr:* parts (housenumber, street, city, state, postcode), plus `lat` and `lon`."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row = {key.strip().lower().removeprefix("addr:"): (value or "").strip() for key, value in row.items() if key}
+            address = row.get("address")
+            if not address:
+                street = " ".join(part for part in (row.get("housenumber"), row.get("street")) if part)
+                region = " ".join(part for part in (row.get("state"), row.get("postcode")) if part)
+                address = ", ".join(part for part in (street, row.get("city"), region) if part)
+            try:
+                yield address, float(row["lat"]), float(row["lon"])
+            except (KeyError, ValueError):
+                logger.warning(f"Skipping gazetteer row without usable coordinates: {address}")
+
+def import_places(db_path: str, places: Iterable[tuple[str, float, float]], replace: bool = False) -> int:
+    """Load places into the store (creating it if needed) and rebuild the FTS index."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executescript(SCHEMA)
+        if replace:
+            conn.execute("DELETE FROM places")
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR REPLACE INTO places (address, norm, lat, lon) VALUES (?, ?, ?, ?)",
+            ((address, normalize_tokens(address), lat, lon) for address, lat, lon in places if address),
+        )
+        imported = conn.total_changes - before
+        conn.commit()
+    finally:
+        conn.close()
+    rebuild_index(db_path)
+    return imported
+
+def rebuild_index(db_path: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.execute("INSERT INTO places_fts(places_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO places_fts(places_fts) VALUES ('optimize')")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+class LocalGeocoder(GeocoderBackend):
+    """Offline lookups against a SQLite store built by geocoder_import.py.
+
+    An exact match on the normalized address is a single index probe; otherwise every query
+    token must appear in the place (FTS5 AND query) and the best bm25 match wins.
+    """
+
+    name = "local"
+
+    def __init__(self, db_path: str, min_tokens: int = LOCAL_GEOCODER_MIN_TOKENS):
+        self.db_path = db_path
+        self.min_tokens = min_tokens
+        # Read-only; lookups are sub-millisecond so they run inline on the event loop
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, address: str) -> Optional[tuple[float, float]]:
+        tokens = address_tokens(address)
+        if not tokens:
+            return None
+        row = self.conn.execute("SELECT lat, lon FROM places WHERE norm = ?", (" ".join(tokens),)).fetchone()
+        if row is None and len(tokens) >= self.min_tokens:
+            match = " ".join(f'"{token}"' for token in dict.fromkeys(tokens))
+            row = self.conn.execute(
+                "SELECT p.lat, p.lon FROM places_fts JOIN places p ON p.id = places_fts.rowid "
+                "WHERE places_fts MATCH ? ORDER BY bm25(places_fts) LIMIT 1",
+                (match,),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], row[1]
+
+    async def geocode(self, address: str) -> Optional[tuple[float, float]]:
+        return self.lookup(address)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.conn.close()
+
+def build_backends(names: list[str] = GEOCODER_BACKENDS, local_db: str = LOCAL_GEOCODER_DB) -> list[GeocoderBackend]:
+    backends: list[GeocoderBackend] = []
+    for name in names:
+        if name == "local":
+            if local_db and os.path.exists(local_db):
+                backends.append(LocalGeocoder(local_db))
+            elif local_db:
+                logger.warning(f"LOCAL_GEOCODER_DB not found, local geocoder disabled: {local_db}")
+        elif name == "nominatim":
+            backends.append(NominatimGeocoder())
+        else:
+            logger.warning(f"Unknown geocoder backend ignored: {name}")
+    return backends
+
+geocoder_backends = build_backends()
+
+async def geocode_address(address: str) -> tuple[float, float]:
+    """Resolve an address with the configured backends, in order."""
+    for backend in geocoder_backends:
+        with GEOCODE_SECONDS.time(backend.name):
+            coords = await backend.geocode(address)
+        if coords is not None:
+            return coords
+    raise AddressNotFoundError(f"Address not found: {address}")
@@ -0,0 +1,109 @@
+# history.py
+# Filtered, keyset-paginated history queries for the /history endpoint
+
+import io
+import csv
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import or_, tuple_
+from sqlalchemy.future import select
+
+from models import Query
+from encoding import dumps
+from config import HISTORY_EXPORT_BATCH_SIZE
+
+# QueryRead's fields; pages and exports select these columns instead of ORM entities
+HISTORY_COLUMNS = ("id", "source", "destination", "miles", "kilometers", "timestamp")
+EXPORT_COLUMNS = HISTORY_COLUMNS
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@dataclass
+class HistoryFilters:
+    address: Optional[str] = None  # substring of source or destination
+    source: Optional[str] = None
+    destination: Optional[str] = None
+    min_miles: Optional[float] = None
+    max_miles: Optional[float] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+def encode_cursor(timestamp: datetime, query_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{query_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, query_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(query_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _contains(column, term: str):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+def apply_filters(stmt, filters: HistoryFilters):
+    if filters.address:
+        stmt = stmt.where(or_(_contains(Query.source, filters.address), _contains(Query.destination, filters.address)))
+    if filters.source:
+        stmt = stmt.where(_contains(Query.source, filters.source))
+    if filters.destination:
+        stmt = stmt.where(_contains(Query.destination, filters.destination))
+    if filters.min_miles is not None:
+        stmt = stmt.where(Query.miles >= filters.min_miles)
+    if filters.max_miles is not None:
+        stmt = stmt.where(Query.miles <= filters.max_miles)
+    if filters.start is not None:
+        stmt = stmt.where(Query.timestamp >= filters.start)
+    if filters.end is not None:
+        stmt = stmt.where(Query.timestamp < filters.end)
+    return stmt
+
+def history_page_query(filters: HistoryFilters, limit: int, cursor: Optional[str] = None):
+    """Newest-first page of at most `limit` + 1 rows; the extra row signals a next page."""
+    stmt = apply_filters(select(*(getattr(Query, name) for name in HISTORY_COLUMNS)), filters)
+    if cursor:
+        timestamp, query_id = decode_cursor(cursor)
+        # Row-value comparison, so the (timestamp, id) index serves it as a range start (Postgres,
+        # SQLite >= 3.15); the equivalent OR form is only applied as a filter
+        stmt = stmt.where(tuple_(Query.timestamp, Query.id) < tuple_(timestamp, query_id))
+    return stmt.order_by(Query.timestamp.desc(), Query.id.desc()).limit(limit + 1)
+
+def export_query(filters: HistoryFilters, since_id: Optional[int] = None):
+    """Plain column select in id order, for incremental exports."""
+    stmt = apply_filters(select(*(getattr(Query, name) for name in EXPORT_COLUMNS)), filters)
+    if since_id is not None:
+        stmt = stmt.where(Query.id > since_id)
+    return stmt.order_by(Query.id)
+
+def history_items(rows) -> list[dict]:
+    """QueryRead-shaped dicts straight from column rows, without building models."""
+    return [dict(zip(HISTORY_COLUMNS, row)) for row in rows]
+
+def _encode_ndjson(rows) -> bytes:
+    return b"".join(dumps(item) + b"\n" for item in history_items(rows))
+
+def _encode_csv(rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows((*row[:5], row[5].isoformat() if row[5] is not None else "") for row in rows)
+    return buffer.getvalue()
+
+async def stream_export(session_factory, stmt, fmt: str,
+                        batch_size: int = HISTORY_EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Stream `stmt` through a server-side cursor, encoding one batch of rows at a time."""
+    async with session_factory() as db:
+        result = await db.stream(stmt.execution_options(yield_per=batch_size))
+        header = True
+        async for rows in result.partitions():
+            yield _encode_csv(rows, header).encode() if fmt == "csv" else _encode_ndjson(rows)
+            header = False
+        if header and fmt == "csv":
+            # Empty export still gets a header row
+            yield _encode_csv([], True).encode()
+
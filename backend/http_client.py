@@ -0,0 +1,130 @@
+# http_client.py
+# Shared, application-scoped HTTP client for Nominatim (connection pooling, keep-alive, optional HTTP/2)
+
+import time
+import asyncio
+import logging
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+from config import (
+    NOMINATIM_MAX_CONNECTIONS,
+    NOMINATIM_MAX_KEEPALIVE,
+    NOMINATIM_KEEPALIVE_EXPIRY,
+    NOMINATIM_HTTP2,
+    NOMINATIM_CONNECT_TIMEOUT,
+    NOMINATIM_READ_TIMEOUT,
+    NOMINATIM_WRITE_TIMEOUT,
+    NOMINATIM_POOL_TIMEOUT,
+)
+
+logger = logging.getLogger("farfetchr.http")
+
+class PooledClient:
+    """Wraps an httpx.AsyncClient and tracks how often requests queue for a pooled connection."""
+
+    def __init__(self, client: httpx.AsyncClient, max_connections: int, pool_timeout: float, http2: bool = False):
+        self.client = client
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        # Mirrors the httpx pool limit so waiting for a connection is measurable
+        self._slots = asyncio.Semaphore(max_connections)
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.pool_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        if self._slots.locked():
+            self.saturated += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.pool_timeout)
+            except asyncio.TimeoutError:
+                self.pool_timeouts += 1
+                raise httpx.PoolTimeout(f"No free Nominatim connection after {self.pool_timeout}s")
+        else:
+            # Free slot: acquire() returns without suspending
+            await self._slots.acquire()
+        waited = time.perf_counter() - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self.client.get(url, **kwargs)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "http2": self.http2,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturated": self.saturated,
+            "pool_timeouts": self.pool_timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "wait_seconds_avg": round(self.wait_seconds_total / self.requests, 6) if self.requests else 0.0,
+        }
+
+def build_client() -> PooledClient:
+    http2 = NOMINATIM_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("NOMINATIM_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=NOMINATIM_MAX_CONNECTIONS,
+        max_keepalive_connections=NOMINATIM_MAX_KEEPALIVE,
+        keepalive_expiry=NOMINATIM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=NOMINATIM_CONNECT_TIMEOUT,
+        read=NOMINATIM_READ_TIMEOUT,
+        write=NOMINATIM_WRITE_TIMEOUT,
+        pool=NOMINATIM_POOL_TIMEOUT,
+    )
+    client = httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+    return PooledClient(client, NOMINATIM_MAX_CONNECTIONS, NOMINATIM_POOL_TIMEOUT, http2=http2)
+
+_shared_client: Optional[PooledClient] = None
+
+async def start_http_client() -> PooledClient:
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = build_client()
+    return _shared_client
+
+async def close_http_client():
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
+
+def get_http_client() -> Optional[PooledClient]:
+    return _shared_client
+
+@asynccontextmanager
+async def nominatim_client():
+    """Yield the shared client, or a short-lived one when running outside the app lifespan."""
+    if _shared_client is not None:
+        yield _shared_client
+        return
+    client = build_client()
+    try:
+        yield client
+    finally:
+        await client.aclose()
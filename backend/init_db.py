@@ -1,10 +1,57 @@
+import os
+import fcntl
 import asyncio
+import tempfile
+from contextlib import contextmanager
+from sqlalchemy import text, inspect
+from sqlalchemy.schema import CreateColumn
 from models import Base
 from database import engine
 
+# Arbitrary key shared by every process that initializes the schema
+INIT_LOCK_ID = 0x66617266
+INIT_LOCK_FILE = os.path.join(tempfile.gettempdir(), "farfetchr-init-db.lock")
+
+def create_missing_indexes(sync_conn):
+    # create_all only adds indexes together with new tables; backfill them on existing ones
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+def add_missing_columns(sync_conn):
+    # create_all never alters existing tables; add new nullable columns so old databases keep working
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                ddl = CreateColumn(column).compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+@contextmanager
+def file_lock(path: str = INIT_LOCK_FILE):
+    # Serializes processes on this host; blocks, which is fine before the app serves anything
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 async def init_models():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Safe to run from several workers or containers at once: the check-then-create steps
+    # run under a Postgres advisory lock (or a host-local file lock for other databases)
+    with file_lock():
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                # Held until this transaction commits, so the next process sees the finished schema
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": INIT_LOCK_ID})
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(add_missing_columns)
+            await conn.run_sync(create_missing_indexes)
+    await engine.dispose()
 
 if __name__ == "__main__":
-    asyncio.run(init_models()) 
\ No newline at end of file
+    asyncio.run(init_models())
@@ -1,29 +1,79 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Request, Query as QueryParam
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List
+from typing import Optional
 from datetime import datetime
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
+from contextlib import asynccontextmanager
 import logging
 
-from database import get_db
+from database import get_db, get_sessionmaker, AsyncSessionLocal
 from models import Query, Base
-from schemas import DistanceRequest, DistanceResponse, QueryHistoryList, QueryRead
-from utils import geocode_address, haversine
-from config import RATE_LIMIT, GEOCODE_MAX_RETRIES, GEOCODE_RETRY_DELAY, NOMINATIM_URL
+from schemas import (
+    DistanceRequest, DistanceResponse, QueryHistoryList, BatchDistanceRequest,
+    DistanceMatrixRequest, DistanceMatrixResponse, AutocompleteResponse, AutocompleteSuggestion, NearbyQueryList,
+)
+from utils import haversine, query_coordinates, radius_bbox
+from geocache import (
+    geocode_many, geocode_cached, geocode_cache, inflight, warm_cache, purge_expired, start_cache_purger,
+    stop_cache_purger,
+)
+from batch import stream_batch
+from matrix import build_matrix, encode_f32
+from history import (
+    HistoryFilters, history_page_query, history_items, encode_cursor, export_query, stream_export, EXPORT_MEDIA_TYPES,
+)
+from encoding import json_response
+from autocomplete import autocomplete_index, load_autocomplete
+from nearby import nearby_candidates_query, match_nearby
+from http_client import start_http_client, close_http_client, get_http_client
+from geocoders import geocoder_backends
+from upstream import UpstreamUnavailableError, nominatim_rate, nominatim_breaker
+from writebehind import start_query_writer, stop_query_writer, get_query_writer, QueueFullError
+from metrics import REGISTRY, STAGE_SECONDS
+from shared_state import shared_store, limiter_storage_uri
+from config import (
+    RATE_LIMIT, GEOCODE_MAX_RETRIES, GEOCODE_RETRY_DELAY, NOMINATIM_URL, NOMINATIM_MAX_CONNECTIONS, NOMINATIM_HTTP2,
+    HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, QUERY_WRITE_MODE, AUTOCOMPLETE_RATE_LIMIT, AUTOCOMPLETE_TOP_K,
+    NEARBY_MAX_RADIUS_MILES, NEARBY_MAX_CANDIDATES,
+)
 
 # Set up logger
 logger = logging.getLogger("farfetchr.api")
 logging.basicConfig(level=logging.INFO)
 
-# Create limiter instance with in-memory storage
-limiter = Limiter(key_func=get_remote_address, default_limits=[RATE_LIMIT])
-app = FastAPI()
+# Create limiter instance; counters are in memory unless SHARED_STATE_URL shares them across workers
+limiter = Limiter(key_func=get_remote_address, default_limits=[RATE_LIMIT], storage_uri=limiter_storage_uri())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Nominatim client for the whole process
+    await start_http_client()
+    # Best-effort: a cold cache is fine if the DB isn't reachable yet
+    try:
+        async with AsyncSessionLocal() as db:
+            purged = await purge_expired(db)
+            warmed = await warm_cache(db)
+            indexed = await load_autocomplete(db)
+        logger.info(f"Geocode cache warmed with {warmed} entries ({purged} expired rows purged)")
+        logger.info(f"Autocomplete index built with {indexed} addresses")
+    except SQLAlchemyError as e:
+        logger.warning(f"Geocode cache warm-up skipped: {e}")
+    start_cache_purger(AsyncSessionLocal)
+    if QUERY_WRITE_MODE == "write_behind":
+        start_query_writer(AsyncSessionLocal)
+    yield
+    await stop_cache_purger()
+    # Drain queued rows before the pool and the process go away
+    await stop_query_writer()
+    await close_http_client()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add rate limiter middleware
 app.add_middleware(SlowAPIMiddleware)
@@ -42,6 +92,10 @@ print(f"[CONFIG] RATE_LIMIT={RATE_LIMIT}")
 print(f"[CONFIG] GEOCODE_MAX_RETRIES={GEOCODE_MAX_RETRIES}")
 print(f"[CONFIG] GEOCODE_RETRY_DELAY={GEOCODE_RETRY_DELAY}")
 print(f"[CONFIG] NOMINATIM_URL={NOMINATIM_URL}")
+print(f"[CONFIG] NOMINATIM_MAX_CONNECTIONS={NOMINATIM_MAX_CONNECTIONS}")
+print(f"[CONFIG] NOMINATIM_HTTP2={NOMINATIM_HTTP2}")
+print(f"[CONFIG] QUERY_WRITE_MODE={QUERY_WRITE_MODE}")
+print(f"[CONFIG] SHARED_STATE={type(shared_store).__name__ if shared_store is not None else 'per-process'}")
 
 @app.post("/distance", response_model=DistanceResponse)
 @limiter.limit(RATE_LIMIT)
@@ -50,56 +104,260 @@ async def calculate_distance(
     req: DistanceRequest,
     db: AsyncSession = Depends(get_db)
 ):
-    logger.info(f"POST /distance - source: '{req.source}', destination: '{req.destination}'")
-    try:
-        src_lat, src_lon = await geocode_address(req.source)
-        dest_lat, dest_lon = await geocode_address(req.destination)
-    except Exception as e:
-        logger.error(f"Geocoding failed: {e}")
-        raise HTTPException(status_code=400, detail=str(e))
-    miles, kilometers = haversine(src_lat, src_lon, dest_lat, dest_lon)
+    logger.debug("POST /distance - source: %r, destination: %r", req.source, req.destination)
+    # Both endpoints are resolved concurrently; a failure on either side fails the request
+    with STAGE_SECONDS.time("distance", "geocode"):
+        src, dest = await geocode_many([req.source, req.destination], db)
+    for result in (src, dest):
+        if isinstance(result, BaseException):
+            logger.error(f"Geocoding failed: {result}")
+            # Upstream outages are retryable for the client; bad addresses are not
+            status_code = 503 if isinstance(result, UpstreamUnavailableError) else 400
+            raise HTTPException(status_code=status_code, detail=str(result))
+    src_lat, src_lon = src
+    dest_lat, dest_lon = dest
+    with STAGE_SECONDS.time("distance", "haversine"):
+        miles, kilometers = haversine(src_lat, src_lon, dest_lat, dest_lon)
     now = datetime.utcnow()
-    query = Query(
+    row = dict(
         source=req.source,
         destination=req.destination,
         miles=miles,
         kilometers=kilometers,
-        timestamp=now
+        timestamp=now,
+        **query_coordinates(src, dest),
     )
+    writer = get_query_writer()
+    if writer is not None:
+        # Write-behind: the row is flushed in bulk by a background task
+        try:
+            with STAGE_SECONDS.time("distance", "enqueue"):
+                await writer.submit(row)
+        except QueueFullError as e:
+            logger.error(f"Write-behind queue rejected query: {e}")
+            raise HTTPException(status_code=503, detail="Server busy, please retry")
+    else:
+        try:
+            with STAGE_SECONDS.time("distance", "db_commit"):
+                db.add(Query(**row))
+                await db.commit()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"Database error: {e}")
+            raise HTTPException(status_code=500, detail="Database error")
+    autocomplete_index.add(req.source)
+    autocomplete_index.add(req.destination)
+    logger.debug("POST /distance - success: %s -> %s | %.2f mi, %.2f km", req.source, req.destination, miles, kilometers)
+    # Encoded here rather than by FastAPI after the handler returns, so the stage covers it;
+    # response_model still documents the schema
+    with STAGE_SECONDS.time("distance", "serialize"):
+        return json_response(request, {
+            "miles": miles,
+            "kilometers": kilometers,
+            "source": req.source,
+            "destination": req.destination,
+            "timestamp": now,
+        })
+
+@app.post("/distance/batch", response_class=StreamingResponse)
+@limiter.limit(RATE_LIMIT)
+async def calculate_distance_batch(
+    request: Request,
+    req: BatchDistanceRequest,
+    session_factory = Depends(get_sessionmaker)
+):
+    # Streams one BatchDistanceItem per line (NDJSON), in input order, with per-item errors
+    logger.info(f"POST /distance/batch - {len(req.pairs)} pairs")
+    return StreamingResponse(stream_batch(req.pairs, session_factory), media_type="application/x-ndjson")
+
+@app.post(
+    "/distance/matrix",
+    response_model=DistanceMatrixResponse,
+    responses={200: {"content": {"application/octet-stream": {}}}},
+)
+@limiter.limit(RATE_LIMIT)
+async def calculate_distance_matrix(
+    request: Request,
+    req: DistanceMatrixRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"POST /distance/matrix - {len(req.origins)} x {len(req.destinations)} ({req.output})")
     try:
-        db.add(query)
-        await db.commit()
-        await db.refresh(query)
-        logger.info(f"Distance calculation saved to DB: {req.source} -> {req.destination} | {miles:.2f} mi, {kilometers:.2f} km")
-    except SQLAlchemyError as e:
-        await db.rollback()
-        logger.error(f"Database error: {e}")
-        raise HTTPException(status_code=500, detail="Database error")
-    logger.info(f"POST /distance - success: {req.source} -> {req.destination} | {miles:.2f} mi, {kilometers:.2f} km")
-    return DistanceResponse(
-        miles=miles,
-        kilometers=kilometers,
-        source=req.source,
-        destination=req.destination,
-        timestamp=now
-    )
+        miles, kilometers = await build_matrix(req, db)
+    except ValueError as e:
+        logger.error(f"Distance matrix failed: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    if req.output == "f32":
+        return Response(
+            content=encode_f32(miles, kilometers),
+            media_type="application/octet-stream",
+            headers={"X-Matrix-Rows": str(miles.shape[0]), "X-Matrix-Cols": str(miles.shape[1])},
+        )
+    # Encode the arrays directly; response_model only documents the schema
+    return json_response(request, {"miles": miles, "kilometers": kilometers})
 
 @app.get("/history", response_model=QueryHistoryList)
 @limiter.limit(RATE_LIMIT)
 async def get_history(
     request: Request,
+    address: Optional[str] = QueryParam(None, max_length=200, description="Substring of source or destination"),
+    source: Optional[str] = QueryParam(None, max_length=200),
+    destination: Optional[str] = QueryParam(None, max_length=200),
+    min_miles: Optional[float] = QueryParam(None, ge=0),
+    max_miles: Optional[float] = QueryParam(None, ge=0),
+    start: Optional[datetime] = QueryParam(None, description="Inclusive lower bound on timestamp"),
+    end: Optional[datetime] = QueryParam(None, description="Exclusive upper bound on timestamp"),
+    limit: int = QueryParam(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = QueryParam(None, description="next_cursor from the previous page"),
     db: AsyncSession = Depends(get_db)
 ):
-    logger.info("GET /history")
+    logger.debug("GET /history")
+    filters = HistoryFilters(address, source, destination, min_miles, max_miles, start, end)
+    try:
+        stmt = history_page_query(filters, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        result = await db.execute(select(Query).order_by(Query.timestamp.desc()))
-        queries: List[Query] = result.scalars().all()
-        logger.info(f"GET /history - returned {len(queries)} records")
-        return QueryHistoryList(history=[QueryRead.model_validate(q, from_attributes=True) for q in queries])
+        with STAGE_SECONDS.time("history", "db_query"):
+            result = await db.execute(stmt)
+            rows = result.all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+        logger.debug("GET /history - returned %d records", len(rows))
+        # Rows are already QueryRead-shaped: encode them directly instead of validating models
+        # twice; response_model still documents the schema
+        with STAGE_SECONDS.time("history", "serialize"):
+            return json_response(request, {"history": history_items(rows), "next_cursor": next_cursor})
     except SQLAlchemyError as e:
         logger.error(f"Database error on /history: {e}")
         raise HTTPException(status_code=500, detail="Database error")
 
+@app.get("/autocomplete", response_model=AutocompleteResponse)
+@limiter.limit(AUTOCOMPLETE_RATE_LIMIT)
+async def autocomplete(
+    request: Request,
+    q: str = QueryParam(..., min_length=2, max_length=200, description="Address prefix"),
+    limit: int = QueryParam(8, ge=1, le=AUTOCOMPLETE_TOP_K),
+):
+    # Served from the in-memory index only: no geocoding and no DB round trip
+    suggestions = autocomplete_index.suggest(q, limit)
+    return AutocompleteResponse(
+        suggestions=[AutocompleteSuggestion(address=address, count=count) for address, count in suggestions]
+    )
+
+@app.get("/history/nearby", response_model=NearbyQueryList)
+@limiter.limit(RATE_LIMIT)
+async def get_nearby_history(
+    request: Request,
+    lat: Optional[float] = QueryParam(None, ge=-90, le=90, description="Search center (with lon and radius_miles)"),
+    lon: Optional[float] = QueryParam(None, ge=-180, le=180),
+    address: Optional[str] = QueryParam(None, min_length=5, max_length=200, description="Search center to geocode"),
+    radius_miles: Optional[float] = QueryParam(None, gt=0, le=NEARBY_MAX_RADIUS_MILES),
+    min_lat: Optional[float] = QueryParam(None, ge=-90, le=90, description="Bounding box (instead of a radius)"),
+    min_lon: Optional[float] = QueryParam(None, ge=-180, le=180),
+    max_lat: Optional[float] = QueryParam(None, ge=-90, le=90),
+    max_lon: Optional[float] = QueryParam(None, ge=-180, le=180, description="Less than min_lon crosses the antimeridian"),
+    side: str = QueryParam("either", pattern="^(source|destination|either)$"),
+    start: Optional[datetime] = QueryParam(None, description="Inclusive lower bound on timestamp"),
+    end: Optional[datetime] = QueryParam(None, description="Exclusive upper bound on timestamp"),
+    limit: int = QueryParam(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    # Only rows with stored coordinates are searched; run backfill_coordinates.py for older ones
+    box_params = (min_lat, min_lon, max_lat, max_lon)
+    has_center = address is not None or lat is not None or lon is not None
+    if has_center == all(p is not None for p in box_params) or (not has_center and any(p is None for p in box_params)):
+        raise HTTPException(status_code=400, detail="Give either a center (lat/lon or address) with radius_miles, or min_lat/min_lon/max_lat/max_lon")
+    center = radius_km = None
+    if has_center:
+        if radius_miles is None or (address is None and (lat is None or lon is None)):
+            raise HTTPException(status_code=400, detail="A center search needs lat and lon (or address) and radius_miles")
+        if address is not None:
+            try:
+                center = await geocode_cached(address, db)
+            except ValueError as e:
+                status_code = 503 if isinstance(e, UpstreamUnavailableError) else 400
+                raise HTTPException(status_code=status_code, detail=str(e))
+        else:
+            center = (lat, lon)
+        radius_km = radius_miles * 1.609344
+        box = radius_bbox(center[0], center[1], radius_km)
+    else:
+        if min_lat > max_lat:
+            raise HTTPException(status_code=400, detail="min_lat must not exceed max_lat")
+        box = box_params
+    stmt = nearby_candidates_query(box, side, HistoryFilters(start=start, end=end), NEARBY_MAX_CANDIDATES)
+    try:
+        with STAGE_SECONDS.time("nearby", "db_query"):
+            rows = (await db.execute(stmt)).all()
+    except SQLAlchemyError as e:
+        logger.error(f"Database error on /history/nearby: {e}")
+        raise HTTPException(status_code=500, detail="Database error")
+    if len(rows) > NEARBY_MAX_CANDIDATES:
+        raise HTTPException(status_code=400, detail="Search area matches too many queries; narrow it or add start/end")
+    with STAGE_SECONDS.time("nearby", "haversine"):
+        results = match_nearby(rows, side, limit, center=center, radius_km=radius_km, box=None if center else box)
+    return json_response(request, {"results": results})
+
+@app.get("/history/export", response_class=StreamingResponse)
+@limiter.limit(RATE_LIMIT)
+async def export_history(
+    request: Request,
+    format: str = QueryParam("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = QueryParam(None, description="Inclusive lower bound on timestamp"),
+    end: Optional[datetime] = QueryParam(None, description="Exclusive upper bound on timestamp"),
+    since_id: Optional[int] = QueryParam(None, ge=0, description="Only rows with a larger id (incremental exports)"),
+    session_factory = Depends(get_sessionmaker)
+):
+    # Rows are streamed in id order, so the last exported id is the next run's since_id
+    logger.info(f"GET /history/export - format={format} since_id={since_id}")
+    stmt = export_query(HistoryFilters(start=start, end=end), since_id)
+    return StreamingResponse(
+        stream_export(session_factory, stmt, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="history.{format}"'},
+    )
+
+@app.get("/stats")
+def get_stats():
+    pool = get_http_client()
+    writer = get_query_writer()
+    return {
+        "geocode_cache": geocode_cache.stats(),
+        "geocode_inflight": inflight.stats(),
+        "geocoders": [backend.stats() for backend in geocoder_backends],
+        "nominatim_rate": nominatim_rate.stats(),
+        "nominatim_circuit": nominatim_breaker.stats(),
+        "http_pool": pool.stats() if pool is not None else None,
+        "query_writer": writer.stats() if writer is not None else None,
+        "autocomplete": autocomplete_index.stats(),
+        "shared_state": {"backend": type(shared_store).__name__, "ok": shared_store.check()} if shared_store is not None else None,
+    }
+
+def _gauges():
+    pool = get_http_client()
+    writer = get_query_writer()
+    cache = geocode_cache.stats()
+    yield "farfetchr_geocode_cache_entries", "Entries in the in-memory geocode cache", {(): cache["size"]}
+    yield "farfetchr_autocomplete_entries", "Addresses in the autocomplete index", {(): len(autocomplete_index)}
+    yield "farfetchr_geocode_inflight", "Upstream geocodes currently in flight", {(): inflight.stats()["in_flight"]}
+    yield "farfetchr_nominatim_circuit_open", "1 while the Nominatim circuit breaker is not closed", {
+        (): int(nominatim_breaker.state != "closed")
+    }
+    if pool is not None:
+        yield "farfetchr_http_pool_in_flight", "Nominatim requests holding a pool slot", {(): pool.stats()["in_flight"]}
+    if writer is not None:
+        yield "farfetchr_write_behind_queue_depth", "Rows waiting in the write-behind queue", {(): writer.stats()["queue_depth"]}
+
+REGISTRY.register_gauges(_gauges)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    # Prometheus text exposition format
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {
@@ -0,0 +1,35 @@
+# matrix.py
+# N x M distance matrices for the /distance/matrix endpoint
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from schemas import DistanceMatrixRequest, Coordinate
+from utils import haversine_matrix
+from geocache import geocode_many
+from config import BATCH_GEOCODE_CONCURRENCY, MATRIX_MAX_CELLS
+
+async def _resolve_points(points: list, db: AsyncSession) -> np.ndarray:
+    """Return an (n, 2) lat/lon array; addresses are geocoded once each through the cache tiers."""
+    addresses = list(dict.fromkeys(p for p in points if not isinstance(p, Coordinate)))
+    resolved = dict(zip(addresses, await geocode_many(addresses, db, concurrency=BATCH_GEOCODE_CONCURRENCY)))
+    failed = [str(r) for r in resolved.values() if isinstance(r, BaseException)]
+    if failed:
+        raise ValueError("; ".join(failed))
+    return np.array(
+        [(p.lat, p.lon) if isinstance(p, Coordinate) else resolved[p] for p in points],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+
+async def build_matrix(req: DistanceMatrixRequest, db: AsyncSession) -> tuple[np.ndarray, np.ndarray]:
+    cells = len(req.origins) * len(req.destinations)
+    if cells > MATRIX_MAX_CELLS:
+        raise ValueError(f"Matrix too large: {cells} cells (max {MATRIX_MAX_CELLS})")
+    origins = await _resolve_points(req.origins, db)
+    destinations = await _resolve_points(req.destinations, db)
+    dtype = np.float32 if req.output == "f32" else np.float64
+    return haversine_matrix(origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1], dtype=dtype)
+
+def encode_f32(miles: np.ndarray, kilometers: np.ndarray) -> bytes:
+    # Miles matrix followed by kilometers matrix, row-major little-endian float32
+    return miles.astype("<f4", copy=False).tobytes() + kilometers.astype("<f4", copy=False).tobytes()
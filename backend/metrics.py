@@ -0,0 +1,125 @@
+# metrics.py
+# Low-overhead Prometheus-style metrics (counters, histograms) rendered by the /metrics endpoint
+
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labelvalues, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {value}"
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+        return False
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labelvalues) -> _Timer:
+        """Context manager observing the wall time of its block."""
+        return _Timer(self, labelvalues)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}"
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # Callables returning (name, documentation, {labels: value}) for point-in-time gauges
+        self._gauges: list[Callable[[], Iterable[tuple[str, str, dict]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_gauges(self, collector: Callable[[], Iterable[tuple[str, str, dict]]]):
+        self._gauges.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._gauges:
+            for name, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples.items():
+                    names = tuple(key for key, _ in labels)
+                    values = tuple(val for _, val in labels)
+                    lines.append(f"{name}{_labels(names, values)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "farfetchr_stage_seconds", "Time spent per request stage", ("endpoint", "stage"),
+))
+GEOCODE_SECONDS = REGISTRY.register(Histogram(
+    "farfetchr_geocode_seconds", "Geocode lookup time per cache tier or backend", ("tier",),
+))
+UPSTREAM_ATTEMPT_SECONDS = REGISTRY.register(Histogram(
+    "farfetchr_upstream_attempt_seconds", "Duration of individual Nominatim requests", ("outcome",),
+))
+UPSTREAM_RESPONSES = REGISTRY.register(Counter(
+    "farfetchr_upstream_responses_total", "Nominatim responses by HTTP status (or 'error')", ("status",),
+))
@@ -1,12 +1,21 @@
 # models.py
 # SQLAlchemy models for FarFetchr backend
 
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Index, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 
 Base = declarative_base()
 
+# Trigram indexes below need pg_trgm; other dialects skip both the extension and the indexes
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+GeohashType = String(12).with_variant(String(12, collation="C"), "postgresql")
+
 class Query(Base):
     __tablename__ = "queries"
     id = Column(Integer, primary_key=True, index=True)
@@ -15,5 +24,41 @@ class Query(Base):
     miles = Column(Float, nullable=False)
     kilometers = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    # Resolved coordinates; NULL on rows stored before they were recorded (see backfill_coordinates.py)
+    src_lat = Column(Float, nullable=True)
+    src_lon = Column(Float, nullable=True)
+    dst_lat = Column(Float, nullable=True)
+    dst_lon = Column(Float, nullable=True)
+    # Geohashes of the endpoints; nearby search scans prefix ranges, so Postgres compares them bytewise
+    src_geohash = Column(GeohashType, nullable=True)
+    dst_geohash = Column(GeohashType, nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination for /history walks (timestamp, id) in descending order
+        Index("ix_queries_timestamp_id", "timestamp", "id"),
+        Index("ix_queries_miles", "miles"),
+        Index("ix_queries_src_geohash", "src_geohash"),
+        Index("ix_queries_dst_geohash", "dst_geohash"),
+        # Substring (ILIKE '%...%') address filters on Postgres
+        Index(
+            "ix_queries_source_trgm", "source",
+            postgresql_using="gin", postgresql_ops={"source": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_queries_destination_trgm", "destination",
+            postgresql_using="gin", postgresql_ops={"destination": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+class GeocodeCacheEntry(Base):
+    __tablename__ = "geocode_cache"
+    # Normalized address (see utils.normalize_address)
+    address_key = Column(String, primary_key=True)
+    lat = Column(Float, nullable=True)
+    lon = Column(Float, nullable=True)
+    # False for negative entries ("Address not found")
+    found = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 # TODO: Define Query model for storing address queries 
\ No newline at end of file
@@ -0,0 +1,92 @@
+# nearby.py
+# "Queries near X": geohash prefix ranges pick candidate rows, a vectorized haversine check decides
+
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import and_, or_
+from sqlalchemy.future import select
+
+from models import Query
+from history import HistoryFilters, HISTORY_COLUMNS, apply_filters
+from utils import geohash_cover, haversine_vec
+from config import NEARBY_MAX_CELLS
+
+NEARBY_COLUMNS = HISTORY_COLUMNS + ("src_lat", "src_lon", "dst_lat", "dst_lon")
+# side -> (geohash, lat, lon) columns
+SIDE_COLUMNS = {
+    "source": (Query.src_geohash, Query.src_lat, Query.src_lon),
+    "destination": (Query.dst_geohash, Query.dst_lat, Query.dst_lon),
+}
+SIDES = {"source": ("source",), "destination": ("destination",), "either": ("source", "destination")}
+
+def _in_cells(geohash, cells: list[str]):
+    # Every geohash starting with `cell` sorts in [cell, cell + "~"): "~" is above the base32 alphabet
+    return or_(*(and_(geohash >= cell, geohash < cell + "~") for cell in cells))
+
+def _in_box(lat, lon, box: tuple[float, float, float, float]):
+    min_lat, min_lon, max_lat, max_lon = box
+    lon_ok = lon.between(min_lon, max_lon) if min_lon <= max_lon else or_(lon >= min_lon, lon <= max_lon)
+    return and_(lat.between(min_lat, max_lat), lon_ok)
+
+def nearby_candidates_query(box: tuple[float, float, float, float], side: str,
+                            filters: Optional[HistoryFilters] = None, max_candidates: int = 0,
+                            max_cells: int = NEARBY_MAX_CELLS):
+    """Rows with an endpoint on `side` inside the box (min_lat, min_lon, max_lat, max_lon).
+
+    The geohash ranges are what the indexes serve; the lat/lon box filter only trims the
+    cells' overhang. `max_candidates` + 1 rows at most are fetched, so callers can detect
+    an area that is too large to check exactly.
+    """
+    cells = geohash_cover(*box, max_cells=max_cells)
+    conditions = [
+        and_(_in_cells(geohash, cells), _in_box(lat, lon, box))
+        for geohash, lat, lon in (SIDE_COLUMNS[name] for name in SIDES[side])
+    ]
+    stmt = select(*(getattr(Query, name) for name in NEARBY_COLUMNS)).where(or_(*conditions))
+    if filters is not None:
+        stmt = apply_filters(stmt, filters)
+    if max_candidates:
+        stmt = stmt.limit(max_candidates + 1)
+    return stmt
+
+def _side_arrays(rows, side: str) -> tuple[np.ndarray, np.ndarray]:
+    lat_index, lon_index = (6, 7) if side == "source" else (8, 9)
+    coords = np.array([(row[lat_index], row[lon_index]) for row in rows], dtype=np.float64).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+def match_nearby(rows, side: str, limit: int, center: Optional[tuple[float, float]] = None,
+                 radius_km: Optional[float] = None,
+                 box: Optional[tuple[float, float, float, float]] = None) -> list[dict]:
+    """Exact filter over candidate rows, in one numpy pass per side.
+
+    With a center and radius, results are nearest first and carry distance_miles (to the
+    nearer matching endpoint); with a box, newest first.
+    """
+    if not rows:
+        return []
+    nearest = np.full(len(rows), np.inf)
+    matched = np.zeros(len(rows), dtype=bool)
+    for name in SIDES[side]:
+        lat, lon = _side_arrays(rows, name)
+        if center is not None:
+            miles, km = haversine_vec(center[0], center[1], lat, lon)
+            within = km <= radius_km
+            nearest = np.where(within, np.minimum(nearest, miles), nearest)
+        else:
+            min_lat, min_lon, max_lat, max_lon = box
+            lon_ok = (lon >= min_lon) & (lon <= max_lon) if min_lon <= max_lon else (lon >= min_lon) | (lon <= max_lon)
+            within = (lat >= min_lat) & (lat <= max_lat) & lon_ok
+        matched |= within
+    indexes = np.flatnonzero(matched)
+    if center is not None:
+        indexes = indexes[np.argsort(nearest[indexes], kind="stable")]
+    else:
+        # Newest first, like /history
+        indexes = sorted(indexes, key=lambda i: (rows[i][5], rows[i][0]), reverse=True)
+    results = []
+    for i in indexes[:limit]:
+        item = dict(zip(NEARBY_COLUMNS, rows[i]))
+        item["distance_miles"] = float(nearest[i]) if center is not None else None
+        results.append(item)
+    return results
@@ -4,8 +4,9 @@
 # TODO: Define request and response schemas for /distance and /history endpoints 
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, List, Optional, Union, Literal
 from datetime import datetime
+from config import BATCH_MAX_PAIRS, MATRIX_MAX_POINTS
 
 class DistanceRequest(BaseModel):
     source: str = Field(
@@ -42,4 +43,59 @@ class QueryRead(BaseModel):
         orm_mode = True
 
 class QueryHistoryList(BaseModel):
-    history: List[QueryRead] 
\ No newline at end of file
+    history: List[QueryRead]
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+class NearbyQuery(QueryRead):
+    src_lat: float
+    src_lon: float
+    dst_lat: float
+    dst_lon: float
+    # Miles from the search center to the nearer matching endpoint; None for box searches
+    distance_miles: Optional[float] = None
+
+class NearbyQueryList(BaseModel):
+    results: List[NearbyQuery]
+
+class AutocompleteSuggestion(BaseModel):
+    address: str
+    # Times the address was used in a stored query
+    count: int
+
+class AutocompleteResponse(BaseModel):
+    suggestions: List[AutocompleteSuggestion]
+
+class BatchDistanceRequest(BaseModel):
+    pairs: List[DistanceRequest] = Field(..., min_length=1, max_length=BATCH_MAX_PAIRS)
+
+class BatchDistanceItem(BaseModel):
+    # One NDJSON line of a /distance/batch response; either the distances or error is set
+    index: int
+    source: str
+    destination: str
+    miles: Optional[float] = None
+    kilometers: Optional[float] = None
+    timestamp: Optional[datetime] = None
+    error: Optional[str] = None
+
+class Coordinate(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+# Same constraints as DistanceRequest addresses
+Address = Annotated[str, Field(min_length=5, max_length=200, pattern=r"^[a-zA-Z0-9 ,.-]+$")]
+
+class DistanceMatrixRequest(BaseModel):
+    # Each point is either an address to geocode or a raw {lat, lon}
+    origins: List[Union[Coordinate, Address]] = Field(..., min_length=1, max_length=MATRIX_MAX_POINTS)
+    destinations: List[Union[Coordinate, Address]] = Field(..., min_length=1, max_length=MATRIX_MAX_POINTS)
+    # "f32": application/octet-stream body with the miles then kilometers matrices as
+    # row-major little-endian float32 (shape in X-Matrix-Rows / X-Matrix-Cols headers)
+    output: Literal["json", "f32"] = "json"
+
+class DistanceMatrixResponse(BaseModel):
+    # miles[i][j] / kilometers[i][j]: origins[i] -> destinations[j]
+    miles: List[List[float]]
+    kilometers: List[List[float]]
+
@@ -0,0 +1,47 @@
+# serve.py
+# Run the API with several uvicorn worker processes sharing rate-limit and geocode cache state.
+#
+# Usage (from the backend directory):
+#   python serve.py --workers 4                       # shared state in a SQLite file on tmpfs
+#   SHARED_STATE_URL=redis://localhost:6379/0 python serve.py --workers 8
+#
+# The schema is created once here, before any worker starts. Workers inherit the environment,
+# so per-process settings are derived from the totals given on the command line.
+
+import os
+import asyncio
+import argparse
+import tempfile
+
+import uvicorn
+
+def default_state_url() -> str:
+    # /dev/shm keeps the SQLite file in memory where available
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return f"sqlite:///{os.path.join(directory, 'farfetchr-state.db')}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run FarFetchr with multiple worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--upstream-rate", type=float, default=float(os.getenv("NOMINATIM_RATE_LIMIT", 1.0)),
+                        help="total Nominatim requests/second, split evenly across workers")
+    parser.add_argument("--skip-init-db", action="store_true", help="don't create tables and indexes first")
+    args = parser.parse_args()
+
+    if args.workers > 1 and not os.getenv("SHARED_STATE_URL"):
+        os.environ["SHARED_STATE_URL"] = default_state_url()
+        print(f"[SERVE] SHARED_STATE_URL not set, using {os.environ['SHARED_STATE_URL']}")
+    # The rate governor is per process; each worker gets its share of the total
+    os.environ["NOMINATIM_RATE_LIMIT"] = str(args.upstream_rate / max(1, args.workers))
+
+    if not args.skip_init_db:
+        from init_db import init_models
+        asyncio.run(init_models())
+
+    print(f"[SERVE] {args.workers} workers on {args.host}:{args.port}")
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+# shared_state.py
+# Cross-process key/value state for multi-worker deployments: rate-limit counters and geocode entries
+
+import re
+import time
+import socket
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from typing import Optional
+from urllib.parse import urlparse
+
+from limits.storage import Storage
+
+from config import SHARED_STATE_URL
+
+logger = logging.getLogger("farfetchr.shared_state")
+
+class SharedStore(ABC):
+    """Key/value store visible to every worker process.
+
+    Calls are synchronous and may block (socket or SQLite busy timeouts): async callers run
+    them via asyncio.to_thread. Values are bytes; `ttl` is in seconds.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        ...
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.set_many({key: value}, ttl)
+
+    @abstractmethod
+    def set_many(self, items: dict[str, bytes], ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def incr(self, key: str, amount: int, ttl: float) -> int:
+        """Add `amount` to an integer counter, starting a new one (expiring in `ttl`) if absent."""
+
+    @abstractmethod
+    def expiry(self, key: str) -> Optional[float]:
+        """Epoch seconds at which `key` expires, or None if it is absent or never expires."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def clear(self, prefix: str = "") -> int:
+        ...
+
+    @abstractmethod
+    def check(self) -> bool:
+        ...
+
+    def close(self):
+        pass
+
+class SQLiteStore(SharedStore):
+    """Shared state in a SQLite file (WAL mode). Put it on tmpfs (e.g. /dev/shm) to keep it in memory."""
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM kv WHERE key IN ({placeholders}) AND (expires_at IS NULL OR expires_at > ?)",
+                (*keys, time.time()),
+            ).fetchall()
+        return {key: value if isinstance(value, bytes) else str(value).encode() for key, value in rows}
+
+    def set_many(self, items: dict[str, bytes], ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                ((key, value, expires_at) for key, value in items.items()),
+            )
+
+    def incr(self, key: str, amount: int, ttl: float) -> int:
+        now = time.time()
+        # One statement, so concurrent workers can't both start a fresh window
+        with self._lock:
+            (value,) = self._conn.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END, "
+                "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+                "RETURNING value",
+                (key, amount, now + ttl, now, now),
+            ).fetchone()
+        return int(value)
+
+    def expiry(self, key: str) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def clear(self, prefix: str = "") -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            # Expired rows are otherwise only skipped on read; drop them here as well
+            self._conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def check(self) -> bool:
+        try:
+            with self._lock:
+                self._conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._conn.close()
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+class RedisStore(SharedStore):
+    """Shared state on a Redis-protocol (RESP2) server, without a client library dependency."""
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, password: Optional[str] = None,
+                 prefix: str = "farfetchr:", timeout: float = 1.0):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self._send(setup)
+
+    @staticmethod
+    def _encode(command) -> bytes:
+        parts = [f"*{len(command)}\r\n".encode()]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by shared state server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            return RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from shared state server: {line!r}")
+
+    def _send(self, commands: list) -> list:
+        # Pipelined: all commands are written at once, then every reply is read in order
+        self._sock.sendall(b"".join(self._encode(command) for command in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _execute(self, *commands) -> list:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(list(commands))
+                except (OSError, ConnectionError):
+                    # Reconnect once on a dropped connection
+                    self._close_socket()
+                    if attempt:
+                        raise
+
+    def _close_socket(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+        self._sock = self._reader = None
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        if not keys:
+            return {}
+        (values,) = self._execute(("MGET", *(self.prefix + key for key in keys)))
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items: dict[str, bytes], ttl: Optional[float] = None):
+        if not items:
+            return
+        expire = ("PX", max(1, int(ttl * 1000))) if ttl is not None else ()
+        self._execute(*(("SET", self.prefix + key, value, *expire) for key, value in items.items()))
+
+    def incr(self, key: str, amount: int, ttl: float) -> int:
+        key = self.prefix + key
+        # SET NX creates the counter with its expiry only if it doesn't exist yet. MULTI/EXEC keeps
+        # the pair atomic: otherwise a key expiring in between is recreated by INCRBY without a TTL
+        *_, (_, value) = self._execute(
+            ("MULTI",), ("SET", key, 0, "PX", max(1, int(ttl * 1000)), "NX"), ("INCRBY", key, amount), ("EXEC",)
+        )
+        if isinstance(value, RespError):
+            raise value
+        return value
+
+    def expiry(self, key: str) -> Optional[float]:
+        (remaining,) = self._execute(("PTTL", self.prefix + key))
+        return time.time() + remaining / 1000 if remaining >= 0 else None
+
+    def delete(self, key: str):
+        self._execute(("DEL", self.prefix + key))
+
+    def clear(self, prefix: str = "", batch: int = 1000) -> int:
+        # SCAN walks the keyspace in steps instead of blocking the server like KEYS
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", self.prefix + prefix) + "*"
+        removed = 0
+        cursor = b"0"
+        while True:
+            ((cursor, keys),) = self._execute(("SCAN", cursor, "MATCH", pattern, "COUNT", batch))
+            if keys:
+                (deleted,) = self._execute(("DEL", *keys))
+                removed += deleted
+            if cursor in (b"0", "0"):
+                return removed
+
+    def check(self) -> bool:
+        try:
+            return self._execute(("PING",)) == ["PONG"]
+        except (OSError, ConnectionError, RespError):
+            return False
+
+    def close(self):
+        with self._lock:
+            self._close_socket()
+
+def open_store(url: str) -> Optional[SharedStore]:
+    """sqlite:///path/to/state.db or redis://[:password@]host:port/db; empty means no shared store."""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute.db, as in SQLAlchemy URLs
+        return SQLiteStore(parsed.path[1:])
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisStore(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password)
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {parsed.scheme}")
+
+# What a store may raise when its file or server is unavailable
+STORE_ERRORS = (sqlite3.Error, OSError, ConnectionError, RespError)
+
+class SharedLimiterStorage(Storage):
+    """`limits` storage for slowapi's fixed-window counters, backed by a SharedStore.
+
+    Registered for farfetchr+sqlite:// and farfetchr+redis:// storage URIs.
+    """
+
+    STORAGE_SCHEME = ["farfetchr+sqlite", "farfetchr+redis"]
+    # limits builds keys as "<namespace>/<identifiers>/..."; slowapi uses the default namespace
+    KEY_PREFIX = "LIMITER/"
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.store = open_store(uri.removeprefix("farfetchr+"))
+
+    @property
+    def base_exceptions(self):
+        return STORE_ERRORS
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return self.store.incr(key, amount, expiry)
+
+    def get(self, key: str) -> int:
+        value = self.store.get(key)
+        return int(value) if value is not None else 0
+
+    def get_expiry(self, key: str) -> float:
+        expires_at = self.store.expiry(key)
+        return expires_at if expires_at is not None else time.time()
+
+    def check(self) -> bool:
+        return self.store.check()
+
+    def reset(self) -> Optional[int]:
+        return self.store.clear(self.KEY_PREFIX)
+
+    def clear(self, key: str) -> None:
+        self.store.delete(key)
+
+def limiter_storage_uri(url: str = SHARED_STATE_URL) -> str:
+    # slowapi keeps counters in process memory unless a shared store is configured
+    return f"farfetchr+{url}" if url else "memory://"
+
+shared_store: Optional[SharedStore] = open_store(SHARED_STATE_URL)
@@ -0,0 +1,56 @@
+# singleflight.py
+# In-flight request coalescing: concurrent calls for the same key share one underlying awaitable
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Run at most one `fn()` per key at a time; later callers await the same result.
+
+    Errors propagate to every waiter. A waiter being cancelled does not cancel the
+    shared call unless it was the last one still waiting for it.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self.started = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            self.started += 1
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Forget it first: the task may still await during cleanup, and a caller arriving
+                # meanwhile must start a fresh call rather than join one that ends in CancelledError
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "started": self.started, "shared": self.shared}
@@ -5,8 +5,14 @@ from httpx import ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from main import app
-from models import Base
+from models import Base, Query
+from schemas import DistanceResponse
+from datetime import datetime, timedelta
 import asyncio
+import json
+import numpy as np
+import geocache
+from utils import geohash_encode
 
 DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
@@ -29,8 +35,9 @@ async def client(test_db):
         async with test_db() as session:
             yield session
     app.dependency_overrides = getattr(app, 'dependency_overrides', {})
-    from database import get_db
+    from database import get_db, get_sessionmaker
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_sessionmaker] = lambda: test_db
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
@@ -62,4 +69,240 @@ async def test_history(client):
     response = await client.get("/history")
     assert response.status_code == 200
     data = response.json()
-    assert "history" in data 
\ No newline at end of file
+    assert "history" in data
+
+FAKE_COORDS = {
+    "1 batch st, springfield, il": (39.7817, -89.6501),
+    "2 batch ave, chicago, il": (41.8781, -87.6298),
+}
+
+@pytest.fixture
+def fake_geocoder(monkeypatch):
+    calls = []
+
+    async def fake_geocode(address):
+        calls.append(address)
+        key = geocache.normalize_address(address)
+        if key not in FAKE_COORDS:
+            raise geocache.AddressNotFoundError(f"Address not found: {address}")
+        return FAKE_COORDS[key]
+
+    monkeypatch.setattr(geocache, "geocode_address", fake_geocode)
+    return calls
+
+@pytest.mark.asyncio
+async def test_distance_batch_streams_ndjson(client, fake_geocoder):
+    pairs = [
+        {"source": "1 Batch St, Springfield, IL", "destination": "2 Batch Ave, Chicago, IL"},
+        {"source": "2 Batch Ave, Chicago, IL", "destination": "1 Batch St, Springfield, IL"},
+        {"source": "1 Batch St, Springfield, IL", "destination": "99 Missing Rd, Nowhere, ZZ"},
+    ]
+    response = await client.post("/distance/batch", json={"pairs": pairs})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["index"] for item in items] == [0, 1, 2]
+    assert items[0]["miles"] == pytest.approx(items[1]["miles"])
+    assert abs(items[0]["miles"] - 179) < 1
+    assert "error" in items[2] and "miles" not in items[2]
+    # Each unique address goes upstream once
+    assert len(fake_geocoder) == 3
+
+@pytest.mark.asyncio
+async def test_distance_matrix_json_and_f32(client, fake_geocoder):
+    body = {
+        "origins": ["1 Batch St, Springfield, IL", {"lat": 0, "lon": 0}],
+        "destinations": ["2 Batch Ave, Chicago, IL", {"lat": 0, "lon": 180}, "1 Batch St, Springfield, IL"],
+    }
+    response = await client.post("/distance/matrix", json=body)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["miles"]) == 2 and len(data["miles"][0]) == 3
+    assert abs(data["miles"][0][0] - 179) < 1
+    assert data["kilometers"][0][2] == pytest.approx(0, abs=1e-6)
+    assert abs(data["kilometers"][1][1] - 20015) < 10
+
+    response = await client.post("/distance/matrix", json={**body, "output": "f32"})
+    assert response.status_code == 200
+    assert response.headers["x-matrix-rows"] == "2" and response.headers["x-matrix-cols"] == "3"
+    values = np.frombuffer(response.content, dtype="<f4").reshape(2, 2, 3)
+    assert np.allclose(values[0], data["miles"], rtol=1e-5)
+    assert np.allclose(values[1], data["kilometers"], rtol=1e-5)
+
+@pytest.mark.asyncio
+async def test_distance_matrix_unknown_address(client, fake_geocoder):
+    body = {"origins": ["99 Missing Rd, Nowhere, ZZ"], "destinations": [{"lat": 0, "lon": 0}]}
+    response = await client.post("/distance/matrix", json=body)
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_history_filters_and_keyset_pagination(client, test_db):
+    base = datetime(2024, 1, 1)
+    async with test_db() as session:
+        session.add_all([
+            Query(source=f"{i} Pager St, Testville, TX", destination="1 Depot Rd, Testville, TX",
+                  miles=float(i), kilometers=float(i) * 1.609344,
+                  # Two rows share each timestamp so the id tie-breaker is exercised
+                  timestamp=base + timedelta(minutes=i // 2))
+            for i in range(7)
+        ])
+        await session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"source": "pager st", "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/history", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        seen.extend(q["miles"] for q in data["history"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [6.0, 5.0, 4.0, 3.0, 2.0, 1.0, 0.0]
+
+    response = await client.get("/history", params={"address": "PAGER", "min_miles": 2, "max_miles": 4})
+    assert [q["miles"] for q in response.json()["history"]] == [4.0, 3.0, 2.0]
+
+    response = await client.get("/history", params={"source": "pager", "start": "2024-01-01T00:01:00", "end": "2024-01-01T00:02:00"})
+    assert [q["miles"] for q in response.json()["history"]] == [3.0, 2.0]
+
+    response = await client.get("/history", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_history_compresses_large_pages(client, test_db):
+    async with test_db() as session:
+        session.add_all([
+            Query(source=f"{i} Gzip Ln, Squeezeville, NV", destination="1 Deflate Ct, Squeezeville, NV",
+                  miles=float(i), kilometers=float(i) * 1.609344, timestamp=datetime(2022, 3, 1, 12, 0, i))
+            for i in range(40)
+        ])
+        await session.commit()
+
+    params = {"source": "gzip ln", "limit": 40}
+    response = await client.get("/history", params=params, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    history = response.json()["history"]
+    assert len(history) == 40
+    assert history[0]["timestamp"] == "2022-03-01T12:00:39"
+    assert set(history[0]) == {"id", "source", "destination", "miles", "kilometers", "timestamp"}
+
+    response = await client.get("/history", params={**params, "limit": 1}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+@pytest.mark.asyncio
+async def test_history_export_ndjson_and_csv(client, test_db):
+    async with test_db() as session:
+        rows = [
+            Query(source=f"{i} Export Way, Dumpton, OR", destination="9 Sink St, Dumpton, OR",
+                  miles=float(i), kilometers=float(i) * 1.609344, timestamp=datetime(2023, 6, 1 + i))
+            for i in range(3)
+        ]
+        session.add_all(rows)
+        await session.commit()
+        ids = [row.id for row in rows]
+
+    params = {"start": "2023-06-01T00:00:00", "end": "2023-06-04T00:00:00"}
+    response = await client.get("/history/export", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["id"] for item in items] == ids
+    assert items[0]["timestamp"] == "2023-06-01T00:00:00"
+
+    response = await client.get("/history/export", params={**params, "since_id": ids[0], "format": "csv"})
+    assert response.status_code == 200
+    lines = response.text.strip().splitlines()
+    assert lines[0] == "id,source,destination,miles,kilometers,timestamp"
+    assert [int(line.split(",")[0]) for line in lines[1:]] == ids[1:]
+
+
+@pytest.mark.asyncio
+async def test_metrics_exposes_stage_latencies(client, fake_geocoder):
+    payload = {"source": "1 Batch St, Springfield, IL", "destination": "2 Batch Ave, Chicago, IL"}
+    response = await client.post("/distance", json=payload)
+    assert response.status_code == 200
+    # Same shape as DistanceResponse
+    DistanceResponse.model_validate(response.json())
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'farfetchr_stage_seconds_count{endpoint="distance",stage="geocode"}' in body
+    assert 'farfetchr_stage_seconds_count{endpoint="distance",stage="db_commit"}' in body
+    assert 'farfetchr_stage_seconds_count{endpoint="distance",stage="serialize"}' in body
+    assert "farfetchr_geocode_cache_entries " in body
+
+@pytest.mark.asyncio
+async def test_autocomplete_suggests_resolved_addresses(client, fake_geocoder):
+    payload = {"source": "1 Batch St, Springfield, IL", "destination": "2 Batch Ave, Chicago, IL"}
+    assert (await client.post("/distance", json=payload)).status_code == 200
+    response = await client.get("/autocomplete", params={"q": "2 batch"})
+    assert response.status_code == 200
+    suggestions = response.json()["suggestions"]
+    assert suggestions[0]["address"] == "2 Batch Ave, Chicago, IL"
+    assert suggestions[0]["count"] >= 1
+    assert (await client.get("/autocomplete", params={"q": "x"})).status_code == 422
+
+@pytest.mark.asyncio
+async def test_autocomplete_index_rebuilds_from_queries(test_db, monkeypatch):
+    import autocomplete
+    index = autocomplete.AutocompleteIndex()
+    monkeypatch.setattr(autocomplete, "autocomplete_index", index)
+    async with test_db() as session:
+        session.add_all([
+            Query(source="7 Rebuild Rd, Indexville, KS", destination=f"{i} Other St, Indexville, KS",
+                  miles=1.0, kilometers=1.609344, timestamp=datetime(2021, 1, 1))
+            for i in range(3)
+        ])
+        await session.commit()
+        await autocomplete.load_autocomplete(session)
+    assert index.suggest("7 rebuild") == [("7 Rebuild Rd, Indexville, KS", 3)]
+    assert len(index.suggest("1 other")) == 1
+
+@pytest.mark.asyncio
+async def test_history_nearby_by_radius_and_box(client, fake_geocoder):
+    payload = {"source": "1 Batch St, Springfield, IL", "destination": "2 Batch Ave, Chicago, IL"}
+    assert (await client.post("/distance", json=payload)).status_code == 200
+
+    response = await client.get("/history/nearby", params={"lat": 41.88, "lon": -87.63, "radius_miles": 5})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results and all(r["distance_miles"] <= 5 for r in results)
+    assert all("2 Batch Ave, Chicago, IL" in (r["source"], r["destination"]) for r in results)
+    assert any(r["src_lat"] == pytest.approx(39.7817) for r in results)
+    params = {"lat": 41.88, "lon": -87.63, "radius_miles": 5, "side": "source"}
+    results = (await client.get("/history/nearby", params=params)).json()["results"]
+    assert all(r["source"] == "2 Batch Ave, Chicago, IL" for r in results)
+
+    box = {"min_lat": 39.5, "min_lon": -90.0, "max_lat": 40.0, "max_lon": -89.0, "side": "source"}
+    results = (await client.get("/history/nearby", params=box)).json()["results"]
+    assert results and all(r["source"] == "1 Batch St, Springfield, IL" for r in results)
+    assert all(r["distance_miles"] is None for r in results)
+
+    assert (await client.get("/history/nearby", params={"lat": 41.88, "lon": -87.63})).status_code == 400
+    assert (await client.get("/history/nearby", params={**box, "lat": 1, "lon": 1, "radius_miles": 1})).status_code == 400
+
+@pytest.mark.asyncio
+async def test_backfill_coordinates(test_db, fake_geocoder):
+    from backfill_coordinates import backfill_coordinates
+    async with test_db() as session:
+        session.add_all([
+            Query(source="1 Batch St, Springfield, IL", destination="2 Batch Ave, Chicago, IL",
+                  miles=179.0, kilometers=288.0, timestamp=datetime(2020, 1, 1)),
+            Query(source="1 Batch St, Springfield, IL", destination="99 Missing Rd, Nowhere, ZZ",
+                  miles=1.0, kilometers=1.6, timestamp=datetime(2020, 1, 1)),
+        ])
+        await session.commit()
+    updated, skipped = await backfill_coordinates(test_db, batch_size=1)
+    assert updated >= 1 and skipped >= 1
+    async with test_db() as session:
+        rows = (await session.execute(
+            Query.__table__.select().where(Query.timestamp == datetime(2020, 1, 1)).order_by(Query.id)
+        )).all()
+    assert rows[0].dst_geohash == geohash_encode(41.8781, -87.6298)
+    assert rows[1].src_lat is None
@@ -0,0 +1,49 @@
+from autocomplete import AutocompleteIndex
+
+def test_prefix_matches_ranked_by_frequency():
+    index = AutocompleteIndex()
+    index.add("415 Mission St, San Francisco, CA")
+    for _ in range(3):
+        index.add("415 Market St, San Francisco, CA")
+    index.add("1600 Amphitheatre Pkwy, Mountain View, CA")
+    assert index.suggest("415 m") == [
+        ("415 Market St, San Francisco, CA", 3),
+        ("415 Mission St, San Francisco, CA", 1),
+    ]
+    # Canonicalized like cache keys: case, repeated commas and spaces don't matter
+    assert index.suggest("415  MISSION st,,")[0][0] == "415 Mission St, San Francisco, CA"
+    assert index.suggest("999") == []
+    assert index.suggest("415", limit=1) == [("415 Market St, San Francisco, CA", 3)]
+
+def test_cache_keys_gain_display_form_when_queried():
+    index = AutocompleteIndex()
+    index.add("10 downing st, london", 0)
+    index.add("10 Downing St, London")
+    assert index.suggest("10 d") == [("10 Downing St, London", 1)]
+
+def test_memory_is_bounded_by_dropping_least_used():
+    index = AutocompleteIndex(max_entries=10)
+    for i in range(10):
+        index.add(f"{i} Popular Rd, Town", count=100)
+    for i in range(5):
+        index.add(f"{i} Rare Ln, Town")
+    assert len(index) <= 10
+    assert index.pruned > 0
+    assert len(index.suggest("3 popular")) == 1
+
+def test_broad_prefix_returns_most_used_past_scan_cap():
+    index = AutocompleteIndex(max_scan=50, top_k=5)
+    for i in range(300):
+        index.add(f"1{i:04d} Main St, Town")
+    index.add("10299 Main St, Town", count=500)
+    assert index.suggest("1", limit=3)[0] == ("10299 Main St, Town", 501)
+    # The cached list follows later adds, including keys outside the first max_scan
+    index.add("10250 Main St, Town", count=700)
+    index.add("19999 Main St, Town", count=600)
+    assert [count for _, count in index.suggest("1", limit=3)] == [701, 600, 501]
+    # Same answer as ranking every match
+    exact = AutocompleteIndex(max_scan=10**6)
+    for count, display in index._entries.values():
+        exact.add(display, count)
+    assert index.suggest("1", limit=5) == exact.suggest("1", limit=5)
+    assert index.suggest("10", limit=5) == exact.suggest("10", limit=5)
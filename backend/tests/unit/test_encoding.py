@@ -0,0 +1,41 @@
+import json
+import numpy as np
+from datetime import datetime
+import encoding
+from fastapi import Request
+from encoding import dumps, negotiate_encoding, json_response
+from schemas import QueryHistoryList
+
+def test_dumps_matches_response_model_output():
+    item = {"id": 1, "source": "A", "destination": "B", "miles": 1.5, "kilometers": 2.414016,
+            "timestamp": datetime(2024, 5, 6, 7, 8, 9, 123456)}
+    payload = {"history": [item], "next_cursor": None}
+    expected = QueryHistoryList.model_validate(payload).model_dump(mode="json")
+    assert json.loads(dumps(payload)) == expected
+
+def test_dumps_fallback_without_orjson(monkeypatch):
+    monkeypatch.setattr(encoding, "orjson", None)
+    assert dumps({"t": datetime(2024, 1, 2), "s": "é"}) == '{"t":"2024-01-02T00:00:00","s":"é"}'.encode()
+
+def test_dumps_numpy_arrays(monkeypatch):
+    matrix = np.array([[0.0, 1.25], [179.5, 3.0]])
+    assert json.loads(dumps({"miles": matrix})) == {"miles": matrix.tolist()}
+    monkeypatch.setattr(encoding, "orjson", None)
+    assert json.loads(dumps({"miles": matrix})) == {"miles": matrix.tolist()}
+
+def test_negotiate_encoding(monkeypatch):
+    monkeypatch.setattr(encoding, "brotli", None)
+    assert negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("*") == "gzip"
+    assert negotiate_encoding("") is None
+    monkeypatch.setattr(encoding, "brotli", object())
+    assert negotiate_encoding("gzip, br") == "br"
+    assert negotiate_encoding("br;q=0, gzip") == "gzip"
+
+def test_json_response_compresses_only_within_size_bounds():
+    request = Request({"type": "http", "headers": [(b"accept-encoding", b"gzip")]})
+    payload = {"values": list(range(2000))}
+    assert json_response(request, payload, min_size=100).headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in json_response(request, payload, min_size=100, max_size=1000).headers
+    assert "content-encoding" not in json_response(request, {"a": 1}, min_size=100).headers
@@ -0,0 +1,81 @@
+import pytest
+import geocache
+from geocache import GeocodeCache, MISS, geocode_cached
+from utils import AddressNotFoundError
+
+def test_lru_evicts_least_recently_used():
+    cache = GeocodeCache(maxsize=2, ttl=60, negative_ttl=60)
+    cache.set("a", (1.0, 1.0))
+    cache.set("b", (2.0, 2.0))
+    assert cache.get("a") == (1.0, 1.0)  # touch "a" so "b" is oldest
+    cache.set("c", (3.0, 3.0))
+    assert cache.get("b") is MISS
+    assert cache.get("a") == (1.0, 1.0)
+    assert cache.counters["evictions"] == 1
+
+def test_expired_entries_are_dropped():
+    cache = GeocodeCache(maxsize=10, ttl=60, negative_ttl=60)
+    cache.set("a", (1.0, 1.0), ttl=-1)
+    assert cache.get("a") is MISS
+    assert cache.counters["expirations"] == 1
+    assert len(cache) == 0
+
+@pytest.mark.asyncio
+async def test_geocode_cached_hits_memory_and_caches_negatives(monkeypatch):
+    calls = []
+
+    async def fake_geocode(address):
+        calls.append(address)
+        if "nowhere" in address.lower():
+            raise AddressNotFoundError(f"Address not found: {address}")
+        return 37.0, -122.0
+
+    monkeypatch.setattr(geocache, "geocode_address", fake_geocode)
+    monkeypatch.setattr(geocache, "geocode_cache", GeocodeCache(maxsize=10, ttl=60, negative_ttl=60))
+
+    assert await geocode_cached("415 Mission St, San Francisco, CA") == (37.0, -122.0)
+    # Same normalized key: trailing comma and case differ
+    assert await geocode_cached("415 mission st, San Francisco, CA,") == (37.0, -122.0)
+    assert len(calls) == 1
+
+    for _ in range(2):
+        with pytest.raises(AddressNotFoundError):
+            await geocode_cached("1 Nowhere Lane, Atlantis")
+    assert len(calls) == 2
+    stats = geocache.geocode_cache.stats()
+    assert stats["memory_hits"] == 2
+    assert stats["negative_hits"] == 1
+    assert stats["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_cache_purger_removes_expired_rows_periodically():
+    import asyncio
+    import datetime
+    from sqlalchemy.future import select
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from models import Base, GeocodeCacheEntry
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    now = datetime.datetime.utcnow()
+    async with session_factory() as db:
+        db.add_all([
+            GeocodeCacheEntry(address_key="typo st", found=False, expires_at=now - datetime.timedelta(seconds=1)),
+            GeocodeCacheEntry(address_key="1 main st", lat=1.0, lon=2.0, expires_at=now + datetime.timedelta(days=1)),
+        ])
+        await db.commit()
+    geocache.start_cache_purger(session_factory, interval=0.01)
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            async with session_factory() as db:
+                keys = (await db.execute(select(GeocodeCacheEntry.address_key))).scalars().all()
+            if keys == ["1 main st"]:
+                break
+        assert keys == ["1 main st"]
+    finally:
+        await geocache.stop_cache_purger()
+        await engine.dispose()
@@ -0,0 +1,62 @@
+import os
+import pytest
+import geocoders
+from geocoders import LocalGeocoder, GeocoderBackend, import_places, read_gazetteer_csv, normalize_tokens
+from utils import AddressNotFoundError
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fixtures")
+
+@pytest.fixture
+def local_geocoder(tmp_path):
+    db_path = str(tmp_path / "gazetteer.db")
+    import_places(db_path, read_gazetteer_csv(os.path.join(FIXTURES, "gazetteer.csv")))
+    import_places(db_path, read_gazetteer_csv(os.path.join(FIXTURES, "gazetteer_osm.csv")))
+    geocoder = LocalGeocoder(db_path)
+    yield geocoder
+    geocoder.close()
+
+def test_normalize_tokens_folds_abbreviations():
+    assert normalize_tokens("415 Mission St, Suite 4800") == normalize_tokens("415 MISSION STREET")
+    assert normalize_tokens("233 S Wacker Dr") == "233 south wacker drive"
+
+def test_local_lookup_exact_and_token_match(local_geocoder):
+    assert local_geocoder.lookup("415 Mission St, San Francisco, CA 94105") == (37.7897, -122.3972)
+    # No postcode and spelled-out street type: falls back to the FTS token match
+    assert local_geocoder.lookup("233 South Wacker Drive, Chicago") == (41.8789, -87.6359)
+    # OSM-style extract rows are composed into full addresses
+    assert local_geocoder.lookup("24 Willie Mays Plaza, San Francisco") == (37.7786, -122.3893)
+
+def test_local_lookup_misses(local_geocoder):
+    assert local_geocoder.lookup("1 Nowhere Rd, Atlantis, ZZ") is None
+    # Too short to trust a partial token match
+    assert local_geocoder.lookup("Mission St") is None
+
+def test_backend_without_geocode_cannot_be_created():
+    class Incomplete(GeocoderBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+class StubBackend(GeocoderBackend):
+    name = "stub"
+
+    def __init__(self):
+        self.calls = []
+
+    async def geocode(self, address):
+        self.calls.append(address)
+        return (1.0, 2.0)
+
+@pytest.mark.asyncio
+async def test_chain_falls_back_to_next_backend(local_geocoder, monkeypatch):
+    fallback = StubBackend()
+    monkeypatch.setattr(geocoders, "geocoder_backends", [local_geocoder, fallback])
+    assert await geocoders.geocode_address("1 Infinite Loop, Cupertino, CA") == (37.3318, -122.0312)
+    assert fallback.calls == []
+    assert await geocoders.geocode_address("1 Unknown Way, Cupertino, CA") == (1.0, 2.0)
+    assert fallback.calls == ["1 Unknown Way, Cupertino, CA"]
+
+    monkeypatch.setattr(geocoders, "geocoder_backends", [local_geocoder])
+    with pytest.raises(AddressNotFoundError):
+        await geocoders.geocode_address("1 Unknown Way, Cupertino, CA")
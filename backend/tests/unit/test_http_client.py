@@ -0,0 +1,40 @@
+import asyncio
+import httpx
+import pytest
+from http_client import PooledClient
+
+@pytest.mark.asyncio
+async def test_pooled_client_reports_saturation():
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=[])
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    pool = PooledClient(client, max_connections=1, pool_timeout=5)
+    responses = await asyncio.gather(*(pool.get("http://nominatim.test/search") for _ in range(3)))
+    await pool.aclose()
+
+    assert all(r.status_code == 200 for r in responses)
+    stats = pool.stats()
+    assert stats["requests"] == 3
+    assert stats["peak_in_flight"] == 1
+    assert stats["saturated"] == 2
+    assert stats["wait_seconds_max"] > 0
+
+@pytest.mark.asyncio
+async def test_pooled_client_pool_timeout():
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json=[])
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    pool = PooledClient(client, max_connections=1, pool_timeout=0.01)
+    results = await asyncio.gather(
+        pool.get("http://nominatim.test/search"),
+        pool.get("http://nominatim.test/search"),
+        return_exceptions=True,
+    )
+    await pool.aclose()
+
+    assert isinstance(results[1], httpx.PoolTimeout)
+    assert pool.stats()["pool_timeouts"] == 1
@@ -0,0 +1,32 @@
+from metrics import Counter, Histogram, Registry
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5.0, "a")
+    lines = list(histogram.render())
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 't_seconds_count{stage="a"} 3' in lines
+    assert 't_seconds_sum{stage="a"} 5.55' in lines
+
+def test_timer_observes_block():
+    histogram = Histogram("t_seconds", "test", ("stage",))
+    with histogram.time("b"):
+        pass
+    assert 't_seconds_count{stage="b"} 1' in list(histogram.render())
+
+def test_registry_renders_counters_and_gauges():
+    registry = Registry()
+    counter = registry.register(Counter("t_total", "test", ("status",)))
+    counter.inc("200")
+    counter.inc("200", amount=2)
+    registry.register_gauges(lambda: [("t_depth", "queue depth", {(): 4}), ("t_state", "state", {(("name", "x"),): 1})])
+    text = registry.render()
+    assert "# TYPE t_total counter" in text
+    assert 't_total{status="200"} 3.0' in text
+    assert "# TYPE t_depth gauge" in text
+    assert "t_depth 4.0" in text
+    assert 't_state{name="x"} 1.0' in text
@@ -0,0 +1,210 @@
+import time
+import threading
+import socketserver
+import pytest
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+import geocache
+from geocache import GeocodeCache, geocode_cached
+from shared_state import SharedStore, SQLiteStore, RedisStore, SharedLimiterStorage, open_store, limiter_storage_uri
+
+class RespStub(socketserver.StreamRequestHandler):
+    """Just enough of a Redis server (RESP2) for RedisStore: strings with expiry and counters."""
+
+    data: dict = {}
+    lock = threading.Lock()
+
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def live(self, key):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.time():
+            del self.data[key]
+            item = None
+        return item
+
+    def bulk(self, value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def run(self, command, args):
+        if command == "PING":
+            return b"+PONG\r\n"
+        if command == "MGET":
+            items = [self.live(key) for key in args]
+            return b"*%d\r\n" % len(items) + b"".join(self.bulk(item and item[0]) for item in items)
+        if command == "SET":
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            expires = time.time() + int(options[options.index(b"PX") + 1]) / 1000 if b"PX" in options else None
+            if b"NX" in options and self.live(key) is not None:
+                return b"$-1\r\n"
+            self.data[key] = (value, expires)
+            return b"+OK\r\n"
+        if command == "INCRBY":
+            value, expires = self.live(args[0]) or (b"0", None)
+            value = int(value) + int(args[1])
+            self.data[args[0]] = (str(value).encode(), expires)
+            return b":%d\r\n" % value
+        if command == "PTTL":
+            item = self.live(args[0])
+            ttl = -2 if item is None else -1 if item[1] is None else int((item[1] - time.time()) * 1000)
+            return b":%d\r\n" % ttl
+        if command == "DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args)
+        if command == "SCAN":
+            # Pages through keys in sorted order; a cursor resumes after the last key it returned,
+            # so deletions between calls don't skip anything (as with Redis)
+            cursor, options = int(args[0]), [arg.upper() for arg in args[1:]]
+            pattern = args[options.index(b"MATCH") + 2]
+            count = int(args[options.index(b"COUNT") + 2])
+            prefix = pattern[:-1].replace(b"\\", b"")
+            after = self.cursors.pop(cursor, b"")
+            keys = sorted(key for key in list(self.data) if key.startswith(prefix) and key > after and self.live(key))
+            page = keys[:count]
+            following = 0
+            if len(keys) > count:
+                following = len(self.cursors) + 1
+                self.cursors[following] = page[-1]
+            return (b"*2\r\n" + self.bulk(str(following).encode())
+                    + b"*%d\r\n" % len(page) + b"".join(self.bulk(key) for key in page))
+        return b"-ERR unknown command\r\n"
+
+    def handle(self):
+        queued = None
+        self.cursors = {}
+        while (args := self.read_command()) is not None:
+            command, args = args[0].upper().decode(), args[1:]
+            if command == "MULTI":
+                queued = []
+                reply = b"+OK\r\n"
+            elif command == "EXEC":
+                with self.lock:
+                    replies = [self.run(*item) for item in queued]
+                reply = b"*%d\r\n" % len(replies) + b"".join(replies)
+                queued = None
+            elif queued is not None:
+                queued.append((command, args))
+                reply = b"+QUEUED\r\n"
+            else:
+                with self.lock:
+                    reply = self.run(command, args)
+            self.wfile.write(reply)
+
+@pytest.fixture
+def resp_server():
+    RespStub.data = {}
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RespStub)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteStore(str(tmp_path / "state.db"))
+    else:
+        host, port = request.getfixturevalue("resp_server")
+        store = RedisStore(host, port)
+    yield store
+    store.close()
+
+def test_values_expire_and_clear_by_prefix(store):
+    store.set_many({"a:1": b"one", "a:2": b"two", "b:1": b"three"}, ttl=60)
+    store.set("gone", b"x", ttl=0.01)
+    time.sleep(0.02)
+    assert store.get_many(["a:1", "a:2", "gone", "missing"]) == {"a:1": b"one", "a:2": b"two"}
+    assert store.clear("a:") == 2
+    assert store.get("b:1") == b"three"
+
+def test_redis_clear_scans_in_batches(resp_server):
+    store = RedisStore(*resp_server)
+    store.set_many({f"many:{i}": b"x" for i in range(25)}, ttl=60)
+    store.set("other", b"y", ttl=60)
+    assert store.clear("many:", batch=10) == 25
+    assert store.get_many(["many:0", "many:24", "other"]) == {"other": b"y"}
+    store.close()
+
+def test_counters_start_a_fresh_window_after_expiry(store):
+    assert store.incr("hits", 1, ttl=0.05) == 1
+    assert store.incr("hits", 2, ttl=0.05) == 3
+    assert store.expiry("hits") == pytest.approx(time.time() + 0.05, abs=0.05)
+    time.sleep(0.06)
+    assert store.incr("hits", 1, ttl=60) == 1
+    assert store.check()
+
+def test_sqlite_store_is_shared_between_connections(tmp_path):
+    # Two connections stand in for two worker processes
+    first, second = SQLiteStore(str(tmp_path / "state.db")), SQLiteStore(str(tmp_path / "state.db"))
+    first.incr("LIMITS:ip", 1, ttl=60)
+    assert second.incr("LIMITS:ip", 1, ttl=60) == 2
+    second.set("geocode:x", b"[1.0, 2.0]", ttl=60)
+    assert first.get("geocode:x") == b"[1.0, 2.0]"
+
+def test_limiter_storage_enforces_limit_across_instances(tmp_path, resp_server):
+    host, port = resp_server
+    for uri in (f"farfetchr+sqlite:///{tmp_path}/limits.db", f"farfetchr+redis://{host}:{port}/0"):
+        workers = [FixedWindowRateLimiter(storage_from_string(uri)) for _ in range(2)]
+        assert isinstance(workers[0].storage, SharedLimiterStorage)
+        item = parse("3/minute")
+        hits = [workers[i % 2].hit(item, "127.0.0.1") for i in range(5)]
+        assert hits == [True, True, True, False, False]
+        assert workers[1].get_window_stats(item, "127.0.0.1").remaining == 0
+
+def test_limiter_storage_reset_clears_counters(tmp_path, resp_server):
+    host, port = resp_server
+    for uri in (f"farfetchr+sqlite:///{tmp_path}/reset.db", f"farfetchr+redis://{host}:{port}/0"):
+        storage = storage_from_string(uri)
+        limiter = FixedWindowRateLimiter(storage)
+        item = parse("1/minute")
+        storage.store.set("geocode:kept", b"[1.0, 2.0]", ttl=60)
+        assert limiter.hit(item, "127.0.0.1") and not limiter.hit(item, "127.0.0.1")
+        assert storage.reset() == 1
+        assert limiter.hit(item, "127.0.0.1")
+        # Only limiter counters are cleared
+        assert storage.store.get("geocode:kept") == b"[1.0, 2.0]"
+
+def test_incomplete_store_cannot_be_created():
+    class GetOnly(SharedStore):
+        def get_many(self, keys):
+            return {}
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+def test_open_store_urls(tmp_path):
+    assert open_store("") is None
+    assert isinstance(open_store(f"sqlite:///{tmp_path}/s.db"), SQLiteStore)
+    redis = open_store("redis://:secret@cache:6380/2")
+    assert (redis.address, redis.db, redis.password) == (("cache", 6380), 2, "secret")
+    assert limiter_storage_uri("") == "memory://"
+    assert limiter_storage_uri("redis://cache:6379/0") == "farfetchr+redis://cache:6379/0"
+
+@pytest.mark.asyncio
+async def test_geocode_cache_reads_entries_from_other_workers(monkeypatch, tmp_path):
+    calls = []
+
+    async def fake_geocode(address):
+        calls.append(address)
+        return 37.0, -122.0
+
+    monkeypatch.setattr(geocache, "geocode_address", fake_geocode)
+    monkeypatch.setattr(geocache, "shared_store", SQLiteStore(str(tmp_path / "state.db")))
+    monkeypatch.setattr(geocache, "geocode_cache", GeocodeCache(maxsize=10, ttl=60, negative_ttl=60))
+    assert await geocode_cached("1 Shared Way, Forktown, CA") == (37.0, -122.0)
+
+    # A second worker: empty memory tier, same shared store
+    monkeypatch.setattr(geocache, "geocode_cache", GeocodeCache(maxsize=10, ttl=60, negative_ttl=60))
+    assert await geocode_cached("1 Shared Way, Forktown, CA") == (37.0, -122.0)
+    assert len(calls) == 1
+    assert geocache.geocode_cache.counters["shared_hits"] == 1
@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def lookup():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return (1.0, 2.0)
+
+    results = await asyncio.gather(*(flight.do("k", lookup) for _ in range(5)))
+    assert results == [(1.0, 2.0)] * 5
+    assert calls == 1
+    assert flight.stats() == {"in_flight": 0, "started": 1, "shared": 4}
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_every_waiter():
+    flight = SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(flight.do("k", lookup) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+    assert len(flight) == 0
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_shared_call_alive():
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def lookup():
+        started.set()
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    first = asyncio.create_task(flight.do("k", lookup))
+    second = asyncio.create_task(flight.do("k", lookup))
+    await started.wait()
+    first.cancel()
+    assert await second == "ok"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+@pytest.mark.asyncio
+async def test_last_waiter_cancelling_cancels_shared_call():
+    flight = SingleFlight()
+    finished = False
+
+    async def lookup():
+        nonlocal finished
+        await asyncio.sleep(1)
+        finished = True
+
+    waiter = asyncio.create_task(flight.do("k", lookup))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0)
+    assert len(flight) == 0
+    assert not finished
+
+@pytest.mark.asyncio
+async def test_caller_after_cancellation_starts_fresh_call():
+    flight = SingleFlight()
+    cleaning_up = asyncio.Event()
+    calls = 0
+
+    async def lookup():
+        nonlocal calls
+        calls += 1
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            # Cleanup that itself awaits keeps the cancelled task alive a little longer
+            cleaning_up.set()
+            await asyncio.sleep(0.01)
+            raise
+        return "fresh"
+
+    async def quick():
+        return "fresh"
+
+    waiter = asyncio.create_task(flight.do("k", lookup))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await cleaning_up.wait()
+    assert await flight.do("k", quick) == "fresh"
+    assert calls == 1 and flight.started == 2
@@ -0,0 +1,143 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+import httpx
+import pytest
+import utils
+from http_client import PooledClient
+from upstream import TokenBucket, CircuitBreaker, CircuitOpenError, UpstreamUnavailableError, parse_retry_after, backoff_delay
+from utils import AddressNotFoundError, geocode_nominatim
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [backoff_delay(attempt, base=1.0, cap=5.0) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= d <= 5.0 for d in delays)
+    assert len(set(delays)) > 1
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.06)
+    breaker.before_call()  # trial call allowed
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    # First token is free, the next three wait ~20ms each
+    assert time.monotonic() - start >= 0.055
+    assert bucket.stats()["waits"] == 3
+
+@pytest.fixture
+def nominatim(monkeypatch):
+    """Route geocode_nominatim to a scripted handler with no real waits."""
+    calls = []
+    responses = []
+
+    def handler(request):
+        calls.append(request)
+        return responses.pop(0)
+
+    @asynccontextmanager
+    async def fake_client():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        yield PooledClient(client, max_connections=10, pool_timeout=1)
+        await client.aclose()
+
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(utils, "nominatim_client", fake_client)
+    monkeypatch.setattr(utils, "nominatim_rate", TokenBucket(rate=0))
+    monkeypatch.setattr(utils, "nominatim_breaker", CircuitBreaker(failure_threshold=100, reset_timeout=60))
+    monkeypatch.setattr(utils.asyncio, "sleep", fake_sleep)
+    return calls, responses, sleeps
+
+MATCH = [{"lat": "37.79", "lon": "-122.39", "display_name": "415 Mission St, San Francisco", "type": "building", "importance": 0.5}]
+
+@pytest.mark.asyncio
+async def test_retries_honor_retry_after(nominatim):
+    calls, responses, sleeps = nominatim
+    responses += [httpx.Response(429, headers={"Retry-After": "2"}), httpx.Response(503), httpx.Response(200, json=MATCH)]
+    assert await geocode_nominatim("415 Mission St") == (37.79, -122.39)
+    assert len(calls) == 3
+    assert sleeps[0] == 2.0
+
+@pytest.mark.asyncio
+async def test_unmatched_address_is_not_retried(nominatim):
+    calls, responses, sleeps = nominatim
+    responses.append(httpx.Response(200, json=[{**MATCH[0], "display_name": "elsewhere"}]))
+    with pytest.raises(AddressNotFoundError):
+        await geocode_nominatim("415 Mission St")
+    assert len(calls) == 1 and sleeps == []
+
+@pytest.mark.asyncio
+async def test_exhausted_retries_raise_unavailable(nominatim):
+    calls, responses, sleeps = nominatim
+    responses += [httpx.Response(502)] * utils.GEOCODE_MAX_RETRIES
+    with pytest.raises(UpstreamUnavailableError):
+        await geocode_nominatim("415 Mission St")
+    assert len(calls) == utils.GEOCODE_MAX_RETRIES
+
+@pytest.mark.asyncio
+async def test_zero_retries_raise_unavailable(nominatim, monkeypatch):
+    calls, responses, sleeps = nominatim
+    monkeypatch.setattr(utils, "GEOCODE_MAX_RETRIES", 0)
+    with pytest.raises(UpstreamUnavailableError):
+        await geocode_nominatim("415 Mission St")
+    assert calls == []
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast(nominatim, monkeypatch):
+    calls, responses, sleeps = nominatim
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    monkeypatch.setattr(utils, "nominatim_breaker", breaker)
+    with pytest.raises(CircuitOpenError):
+        await geocode_nominatim("415 Mission St")
+    assert calls == []
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_trial_reopens_circuit(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    monkeypatch.setattr(utils, "nominatim_breaker", breaker)
+    monkeypatch.setattr(utils, "nominatim_rate", TokenBucket(rate=0))
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.Event().wait()
+
+    time.sleep(0.06)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(hang)) as client:
+        pooled = PooledClient(client, max_connections=1, pool_timeout=1)
+        task = asyncio.create_task(utils._nominatim_lookup(pooled, "415 Mission St", "415 Mission St"))
+        await started.wait()
+        assert breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.before_call()  # a new trial is allowed once reset_timeout has passed again
+    assert breaker.state == "half_open"
@@ -1,5 +1,9 @@
+import math
 import pytest
-from utils import haversine, clean_address
+import numpy as np
+from utils import (
+    haversine, haversine_vec, haversine_matrix, clean_address, normalize_address, geohash_encode, geohash_cover, radius_bbox,
+)
 
 def test_haversine_known_points():
     # San Francisco (lat, lon) and Palo Alto (lat, lon)
@@ -19,10 +23,36 @@ def test_haversine_antipodal():
     assert abs(round(km) - 20015) < 10
     assert abs(round(miles) - 12436) < 10
 
+def test_haversine_vec_matches_scalar():
+    lat1, lon1 = [37.7897, 0, 0], [-122.3941, 0, 0]
+    lat2, lon2 = [37.4449, 0, 0], [-122.1617, 0, 180]
+    miles, km = haversine_vec(lat1, lon1, lat2, lon2)
+    for i in range(3):
+        expected_miles, expected_km = haversine(lat1[i], lon1[i], lat2[i], lon2[i])
+        assert miles[i] == pytest.approx(expected_miles)
+        assert km[i] == pytest.approx(expected_km, abs=1e-9)
+
+def test_haversine_matrix_chunked_matches_unchunked():
+    rng = np.random.default_rng(1)
+    lat1, lon1 = rng.uniform(-90, 90, 7), rng.uniform(-180, 180, 7)
+    lat2, lon2 = rng.uniform(-90, 90, 5), rng.uniform(-180, 180, 5)
+    miles, km = haversine_matrix(lat1, lon1, lat2, lon2)
+    chunked_miles, chunked_km = haversine_matrix(lat1, lon1, lat2, lon2, chunk_cells=6)
+    assert km.shape == (7, 5)
+    assert np.allclose(km, chunked_km) and np.allclose(miles, chunked_miles)
+    assert km[3, 2] == pytest.approx(haversine(lat1[3], lon1[3], lat2[2], lon2[2])[1])
+
 def test_clean_address_suite_and_commas():
     assert clean_address('415 Mission St Suite 4800, San Francisco, CA 94105') == '415 Mission St'
     assert clean_address('123 Main St, Suite 2, City, State') == '123 Main St'
 
+def test_normalize_address_keeps_suite_and_city():
+    first = normalize_address('10 Main St Suite 1, Boston, MA')
+    second = normalize_address('10 Main St Suite 2, Springfield, IL')
+    assert first != second
+    assert first == '10 main st suite 1, boston, ma'
+    assert normalize_address('  10 Main St,,  Boston,  MA, ') == normalize_address('10 main st, boston, ma')
+
 def test_clean_address_extra_commas():
     assert clean_address('123 Main St,,, City, State,') == '123 Main St, City, State'
 
@@ -34,4 +64,43 @@ def test_clean_address_odd_punctuation():
     assert clean_address('789 Oak St, , , City, State') == '789 Oak St, City, State'
 
 def test_clean_address_trims_whitespace():
-    assert clean_address('   123 Main St, City, State   ') == '123 Main St, City, State' 
\ No newline at end of file
+    assert clean_address('   123 Main St, City, State   ') == '123 Main St, City, State' 
+
+def test_geohash_encode_known_vector():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_encode(57.64911, 10.40744, 5) == "u4pru"
+
+def test_geohash_cover_contains_points_in_box():
+    box = (39.5, -90.0, 40.0, -89.0)
+    cells = geohash_cover(*box, max_cells=16)
+    assert 0 < len(cells) <= 16
+    for lat, lon in [(39.7817, -89.6501), (39.5, -90.0), (40.0, -89.0)]:
+        assert any(geohash_encode(lat, lon).startswith(cell) for cell in cells)
+
+def test_geohash_cover_across_antimeridian():
+    cells = geohash_cover(-18.0, 179.5, -17.0, -179.5, max_cells=16)
+    for lon in (179.8, -179.8):
+        assert any(geohash_encode(-17.5, lon).startswith(cell) for cell in cells)
+
+def test_radius_bbox_contains_circle():
+    min_lat, min_lon, max_lat, max_lon = radius_bbox(39.7817, -89.6501, 50)
+    assert min_lat < 39.7817 < max_lat and min_lon < -89.6501 < max_lon
+    # Edge of the box along the parallel is ~50 km away
+    assert haversine(39.7817, -89.6501, 39.7817, max_lon)[1] == pytest.approx(50, rel=0.01)
+
+@pytest.mark.parametrize("lat,radius_km", [(60.0, 804.672), (45.0, 804.672), (40.0, 160.9344)])
+def test_radius_bbox_contains_widest_point(lat, radius_km):
+    # Easternmost point of the circle, which lies poleward of the center
+    delta = radius_km / 6371
+    phi = math.radians(lat)
+    east_lat = math.degrees(math.asin(math.sin(phi) / math.cos(delta)))
+    east_lon = math.degrees(math.asin(math.sin(delta) / math.cos(phi)))
+    assert haversine(lat, 0.0, east_lat, east_lon)[1] == pytest.approx(radius_km, rel=1e-6)
+    min_lat, min_lon, max_lat, max_lon = radius_bbox(lat, 0.0, radius_km)
+    assert min_lat <= east_lat <= max_lat
+    assert min_lon <= -east_lon + 1e-9 and east_lon - 1e-9 <= max_lon
+
+def test_radius_bbox_wraps_antimeridian_and_poles():
+    min_lat, min_lon, max_lat, max_lon = radius_bbox(0.0, 179.9, 100)
+    assert min_lon > max_lon
+    assert radius_bbox(89.9, 0.0, 100)[1::2] == (-180.0, 180.0)
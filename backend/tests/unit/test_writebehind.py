@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime
+import pytest
+import pytest_asyncio
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from models import Base, Query
+from writebehind import QueryWriter, QueueFullError
+
+def make_row(i):
+    return dict(source=f"{i} Queue St, City, ST", destination="1 Flush Ave, City, ST",
+                miles=float(i), kilometers=float(i) * 1.609344, timestamp=datetime(2024, 1, 1))
+
+@pytest_asyncio.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+async def count_rows(session_factory):
+    async with session_factory() as db:
+        return (await db.execute(select(func.count(Query.id)))).scalar_one()
+
+@pytest.mark.asyncio
+async def test_flushes_by_batch_size_and_drains_on_stop(session_factory):
+    writer = QueryWriter(session_factory, max_queue=100, batch_size=4, flush_interval=60, put_timeout=1)
+    writer.start()
+    for i in range(10):
+        await writer.submit(make_row(i))
+    # Two full batches go out without waiting for the (long) flush interval
+    for _ in range(100):
+        if writer.written >= 8:
+            break
+        await asyncio.sleep(0.01)
+    assert writer.written == 8
+    await writer.stop()
+    assert await count_rows(session_factory) == 10
+    assert writer.stats()["flushes"] == 3
+
+@pytest.mark.asyncio
+async def test_flushes_by_interval(session_factory):
+    writer = QueryWriter(session_factory, max_queue=100, batch_size=1000, flush_interval=0.05, put_timeout=1)
+    writer.start()
+    await writer.submit(make_row(1))
+    await asyncio.sleep(0.3)
+    assert await count_rows(session_factory) == 1
+    await writer.stop()
+
+@pytest.mark.asyncio
+async def test_backpressure_rejects_when_full(session_factory):
+    # Worker not started: nothing drains the queue
+    writer = QueryWriter(session_factory, max_queue=2, batch_size=10, flush_interval=1, put_timeout=0.01)
+    await writer.submit(make_row(1))
+    await writer.submit(make_row(2))
+    with pytest.raises(QueueFullError):
+        await writer.submit(make_row(3))
+    assert writer.stats()["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_and_worker_survives(session_factory):
+    attempts = []
+
+    def flaky_factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            # A driver error, not a SQLAlchemyError
+            raise ConnectionRefusedError("database is down")
+        return session_factory()
+
+    writer = QueryWriter(flaky_factory, max_queue=10, batch_size=2, flush_interval=60, put_timeout=1,
+                         max_retries=3, retry_delay=0.01)
+    writer.start()
+    await writer.submit(make_row(1))
+    await writer.submit(make_row(2))
+    for _ in range(100):
+        if writer.written >= 2:
+            break
+        await asyncio.sleep(0.01)
+    assert writer.written == 2 and writer.retries == 1 and writer.failed == 0
+    # The worker is still running and keeps flushing
+    await writer.submit(make_row(3))
+    await writer.stop()
+    assert writer.written == 3
+    assert await count_rows(session_factory) == 3
+
+@pytest.mark.asyncio
+async def test_flush_gives_up_after_max_retries(session_factory):
+    def broken_factory():
+        raise OSError("database is down")
+
+    writer = QueryWriter(broken_factory, max_queue=10, batch_size=1, flush_interval=60, put_timeout=1,
+                         max_retries=2, retry_delay=0.001)
+    writer.start()
+    await writer.submit(make_row(1))
+    for _ in range(100):
+        if writer.failed:
+            break
+        await asyncio.sleep(0.01)
+    await writer.stop()
+    assert writer.failed == 1 and writer.retries == 2
+
+@pytest.mark.asyncio
+async def test_stop_skips_backoff_and_counts_dropped_rows(session_factory):
+    def broken_factory():
+        raise ConnectionRefusedError("database is down")
+
+    writer = QueryWriter(broken_factory, max_queue=10, batch_size=1, flush_interval=60, put_timeout=1,
+                         max_retries=5, retry_delay=30)
+    writer.start()
+    for i in range(3):
+        await writer.submit(make_row(i))
+    await asyncio.sleep(0.01)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    # The first batch is in a 30s backoff; stopping cuts it short instead of waiting it out
+    await writer.stop(timeout=5)
+    assert loop.time() - start < 1
+    assert writer.failed == 3 and writer.written == 0
+
+@pytest.mark.asyncio
+async def test_drain_timeout_counts_dropped_rows(session_factory):
+    class HangingSession:
+        async def __aenter__(self):
+            await asyncio.Event().wait()
+
+        async def __aexit__(self, *exc):
+            return False
+
+    writer = QueryWriter(HangingSession, max_queue=10, batch_size=2, flush_interval=60, put_timeout=1)
+    writer.start()
+    for i in range(5):
+        await writer.submit(make_row(i))
+    await asyncio.sleep(0.01)
+    await writer.stop(timeout=0.05)
+    assert writer.failed == 5 and writer.written == 0
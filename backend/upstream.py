@@ -0,0 +1,149 @@
+# upstream.py
+# Upstream call policy for Nominatim: failure classification, backoff, rate governor, circuit breaker
+
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import (
+    GEOCODE_RETRY_DELAY,
+    GEOCODE_RETRY_MAX_DELAY,
+    NOMINATIM_RATE_LIMIT,
+    NOMINATIM_RATE_BURST,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+)
+
+logger = logging.getLogger("farfetchr.upstream")
+
+class UpstreamError(ValueError):
+    """Nominatim rejected the request (4xx other than 429); retrying will not help."""
+
+class RetryableUpstreamError(UpstreamError):
+    """Transport error, 5xx or 429; `retry_after` carries the server's Retry-After hint, if any."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamUnavailableError(UpstreamError):
+    """Retries exhausted or circuit open: the geocoding service is unavailable right now."""
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt: int, base: float = GEOCODE_RETRY_DELAY, cap: float = GEOCODE_RETRY_MAX_DELAY) -> float:
+    # Exponential backoff with full jitter; attempt is 0-based
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class TokenBucket:
+    """Process-wide request rate governor.
+
+    acquire() reserves a token immediately and sleeps until it is due, so concurrent callers
+    are spaced out at `rate` per second after an initial `burst`.
+    """
+
+    def __init__(self, rate: float = NOMINATIM_RATE_LIMIT, burst: int = NOMINATIM_RATE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            wait = -self.tokens / self.rate
+            self.waits += 1
+            self.wait_seconds_total += wait
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "waits": self.waits,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+        }
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures; after `reset_timeout`
+    one trial call is let through (half-open) and its outcome closes or re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+
+    def before_call(self):
+        if self.state == "closed":
+            return
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            return
+        # Open, or half-open with the trial call still outstanding
+        self.rejected += 1
+        raise CircuitOpenError("Geocoding service temporarily unavailable")
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+                logger.warning(f"Nominatim circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self):
+        # A trial that never finished proves nothing; re-open so a later call can try again
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+# Shared by every Nominatim call in this process
+nominatim_rate = TokenBucket()
+nominatim_breaker = CircuitBreaker()
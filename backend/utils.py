@@ -3,92 +3,139 @@
 
 import httpx
 import math
+import numpy as np
 import re
+import time
+import random
 import asyncio
 import logging
-from config import NOMINATIM_URL, GEOCODE_MAX_RETRIES, GEOCODE_RETRY_DELAY
+from config import (
+    NOMINATIM_URL, GEOCODE_MAX_RETRIES, GEOCODE_RETRY_MAX_DELAY, MATRIX_CHUNK_CELLS, GEOHASH_PRECISION,
+    LOG_UPSTREAM_BODIES, LOG_UPSTREAM_SAMPLE_RATE,
+)
+from http_client import nominatim_client
+from metrics import UPSTREAM_ATTEMPT_SECONDS, UPSTREAM_RESPONSES
+from upstream import (
+    UpstreamError, RetryableUpstreamError, UpstreamUnavailableError, RETRYABLE_STATUS,
+    parse_retry_after, backoff_delay, nominatim_rate, nominatim_breaker,
+)
 
 # Set up logger
 logger = logging.getLogger("farfetchr.geocode")
 logging.basicConfig(level=logging.INFO)
 
-def clean_address(address: str) -> str:
-    # Remove 'Suite' and anything after, extra commas, and trim whitespace
-    cleaned = re.sub(r'suite.*$', '', address, flags=re.IGNORECASE)
-    cleaned = re.sub(r'(,\s*)+', ', ', cleaned)  # collapse any sequence of commas and spaces
+def collapse_address(address: str) -> str:
+    # Collapse repeated commas and whitespace and trim; keeps every part of the address
+    cleaned = re.sub(r'(,\s*)+', ', ', address)  # collapse any sequence of commas and spaces
     cleaned = re.sub(r'\s+', ' ', cleaned)       # collapse multiple spaces
     cleaned = re.sub(r',\s*$', '', cleaned)      # remove trailing comma
     return cleaned.strip()
 
+def clean_address(address: str) -> str:
+    # Remove 'Suite' and anything after, extra commas, and trim whitespace
+    return collapse_address(re.sub(r'suite.*$', '', address, flags=re.IGNORECASE))
+
+def normalize_address(address: str) -> str:
+    # Cache key for an address: collapsed and case-folded. Not clean_address: stripping from
+    # "suite" onwards drops the city too, so suites in different cities would share a key
+    return collapse_address(address).lower()
+
+class AddressNotFoundError(ValueError):
+    """Raised when Nominatim answered but the address could not be resolved."""
+
 ACCEPTED_TYPES = {
     "house", "building", "road", "residential", "street", "tertiary", "secondary", "primary"
 }
 
-async def geocode_address(address: str) -> tuple[float, float]:
-    params = {
-        "q": address,
-        "format": "json",
-        "limit": 1,
-    }
-    headers = {"User-Agent": "FarFetchrApp/1.0 (your@email.com)"}
-    attempt = 0
-    last_exception = None
-    while attempt < GEOCODE_MAX_RETRIES:
+NOMINATIM_HEADERS = {"User-Agent": "FarFetchrApp/1.0 (your@email.com)"}
+
+async def _nominatim_lookup(client, address: str, query: str):
+    """One rate-governed, breaker-guarded Nominatim request for `query`.
+
+    Returns (lat, lon), or None when Nominatim has no result. Raises AddressNotFoundError for a
+    result that does not match the address, RetryableUpstreamError for transport errors, 5xx
+    and 429, and UpstreamError for other 4xx responses.
+    """
+    nominatim_breaker.before_call()
+    params = {"q": query, "format": "json", "limit": 1}
+    try:
+        await nominatim_rate.acquire()
+        start = time.perf_counter()
+        response = await client.get(NOMINATIM_URL, params=params, headers=NOMINATIM_HEADERS)
+    except httpx.RequestError as e:
+        UPSTREAM_ATTEMPT_SECONDS.observe(time.perf_counter() - start, "error")
+        UPSTREAM_RESPONSES.inc("error")
+        nominatim_breaker.record_failure()
+        raise RetryableUpstreamError(f"Nominatim request failed: {e!r}") from e
+    except BaseException:
+        # Cancelled (client gone, or the last single-flight waiter left) or an unexpected error:
+        # without this a half-open trial would stay outstanding and block every later lookup
+        nominatim_breaker.record_cancelled()
+        raise
+    UPSTREAM_RESPONSES.inc(str(response.status_code))
+    UPSTREAM_ATTEMPT_SECONDS.observe(
+        time.perf_counter() - start,
+        "retryable" if response.status_code in RETRYABLE_STATUS else "ok" if response.status_code < 400 else "rejected",
+    )
+    if response.status_code in RETRYABLE_STATUS:
+        nominatim_breaker.record_failure()
+        raise RetryableUpstreamError(
+            f"Nominatim returned {response.status_code}",
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+    # Any other answer means upstream is up, even if it rejected this request
+    nominatim_breaker.record_success()
+    if response.status_code >= 400:
+        raise UpstreamError(f"Nominatim returned {response.status_code} for address: {address}")
+    data = response.json()
+    if LOG_UPSTREAM_BODIES or (LOG_UPSTREAM_SAMPLE_RATE and random.random() < LOG_UPSTREAM_SAMPLE_RATE):
+        logger.info("Nominatim response for '%s': %s", query, data)
+    if not data:
+        return None
+    result = data[0]
+    importance = float(result.get("importance", 0))
+    result_type = result.get("type", "")
+    display_name = result.get("display_name", "").lower()
+    address_parts = [part.lower() for part in query.split() if part]
+    if sum(part in display_name for part in address_parts) < 1:
+        logger.warning(f"Geocoding result not matched: {query} -> {display_name}")
+        raise AddressNotFoundError(f"Address not matched: {query}")
+    if importance < 0.1 or result_type not in {"building", "house", "residential"}:
+        logger.warning(f"Geocoding result for '{query}' is low importance ({importance}) or not a building/house/residential (type={result_type}): {display_name}")
+    lat = float(result["lat"])
+    lon = float(result["lon"])
+    logger.debug("Geocoding success for address: %s -> (%s, %s)", query, lat, lon)
+    return lat, lon
+
+async def geocode_nominatim(address: str) -> tuple[float, float]:
+    # The address as given first, then its cleaned form if that differs
+    cleaned = clean_address(address)
+    queries = [address] if cleaned == address else [address, cleaned]
+    last_error = None
+    attempts = 0
+    for attempt in range(GEOCODE_MAX_RETRIES):
+        attempts = attempt + 1
         try:
-            async with httpx.AsyncClient() as client:
-                logger.info(f"Geocoding attempt {attempt+1} for address: {address}")
-                response = await client.get(NOMINATIM_URL, params=params, headers=headers, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-                logger.info(f"Nominatim response for address '{address}': {data}")
-                if data:
-                    result = data[0]
-                    importance = float(result.get("importance", 0))
-                    result_type = result.get("type", "")
-                    display_name = result.get("display_name", "").lower()
-                    address_parts = [part.lower() for part in address.split() if part]
-                    if sum(part in display_name for part in address_parts) < 1:
-                        logger.warning(f"Geocoding result not matched: {address} -> {display_name}")
-                        raise ValueError(f"Address not matched: {address}")
-                    if importance < 0.1 or result_type not in {"building", "house", "residential"}:
-                        logger.warning(f"Geocoding result for '{address}' is low importance ({importance}) or not a building/house/residential (type={result_type}): {display_name}")
-                    lat = float(result["lat"])
-                    lon = float(result["lon"])
-                    logger.info(f"Geocoding success for address: {address} -> ({lat}, {lon})")
-                    return lat, lon
-                # Try again with cleaned address
-                cleaned = clean_address(address)
-                if cleaned != address:
-                    logger.info(f"Retrying with cleaned address: {cleaned}")
-                    params["q"] = cleaned
-                    response = await client.get(NOMINATIM_URL, params=params, headers=headers, timeout=10)
-                    response.raise_for_status()
-                    data = response.json()
-                    logger.info(f"Nominatim response for cleaned address '{cleaned}': {data}")
-                    if data:
-                        result = data[0]
-                        importance = float(result.get("importance", 0))
-                        result_type = result.get("type", "")
-                        display_name = result.get("display_name", "").lower()
-                        address_parts = [part.lower() for part in cleaned.split() if part]
-                        if sum(part in display_name for part in address_parts) < 1:
-                            logger.warning(f"Geocoding result not matched: {cleaned} -> {display_name}")
-                            raise ValueError(f"Address not matched: {cleaned}")
-                        if importance < 0.1 or result_type not in {"building", "house", "residential"}:
-                            logger.warning(f"Geocoding result for cleaned '{cleaned}' is low importance ({importance}) or not a building/house/residential (type={result_type}): {display_name}")
-                        lat = float(result["lat"])
-                        lon = float(result["lon"])
-                        logger.info(f"Geocoding success for cleaned address: {cleaned} -> ({lat}, {lon})")
-                        return lat, lon
-            logger.warning(f"No geocoding result for address: {address} (attempt {attempt+1})")
-        except (httpx.RequestError, httpx.HTTPStatusError, ValueError) as e:
+            async with nominatim_client() as client:
+                logger.debug("Geocoding attempt %d for address: %s", attempt + 1, address)
+                for query in queries:
+                    coords = await _nominatim_lookup(client, address, query)
+                    if coords is not None:
+                        return coords
+            # Upstream answered with no result for any variant: permanent, don't retry
+            logger.warning(f"No geocoding result for address: {address}")
+            raise AddressNotFoundError(f"Address not found: {address}")
+        except RetryableUpstreamError as e:
             logger.error(f"Geocoding API error on attempt {attempt+1} for address '{address}': {e}")
-            last_exception = e
-        attempt += 1
-        if attempt < GEOCODE_MAX_RETRIES:
-            await asyncio.sleep(GEOCODE_RETRY_DELAY)
-    logger.error(f"Geocoding failed after {GEOCODE_MAX_RETRIES} attempts for address: {address}")
-    raise ValueError(f"Address not found after {GEOCODE_MAX_RETRIES} attempts: {address}")
+            last_error = e
+        if attempt + 1 < GEOCODE_MAX_RETRIES:
+            delay = last_error.retry_after if last_error.retry_after is not None else backoff_delay(attempt)
+            if delay > GEOCODE_RETRY_MAX_DELAY:
+                # Upstream asked us to back off for longer than a request can wait
+                break
+            await asyncio.sleep(delay)
+    logger.error(f"Geocoding failed after {attempts} attempts for address: {address}")
+    raise UpstreamUnavailableError(f"Geocoding service unavailable after {attempts} attempts: {address}")
 
 def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> tuple[float, float]:
     R = 6371  # Earth radius in kilometers
@@ -102,4 +149,113 @@ def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> tuple[float
     miles = km * 0.621371
     return miles, km
 
+def haversine_vec(lat1, lon1, lat2, lon2) -> tuple[np.ndarray, np.ndarray]:
+    # Element-wise haversine over equally shaped arrays; same formula as haversine()
+    R = 6371  # Earth radius in kilometers
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    km = R * c
+    miles = km * 0.621371
+    return miles, km
+
+def haversine_matrix(lat1, lon1, lat2, lon2, dtype=np.float64,
+                     chunk_cells: int = MATRIX_CHUNK_CELLS) -> tuple[np.ndarray, np.ndarray]:
+    # All-pairs haversine: result[i, j] is the distance from point i of (lat1, lon1) to point j of
+    # (lat2, lon2). Rows are computed in blocks of ~chunk_cells cells so temporaries stay bounded.
+    R = 6371  # Earth radius in kilometers
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    lam1 = np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    lam2 = np.radians(np.asarray(lon2, dtype=np.float64))[None, :]
+    cos1 = np.cos(phi1)
+    cos2 = np.cos(phi2)
+    n, m = phi1.shape[0], phi2.shape[1]
+    km = np.empty((n, m), dtype=dtype)
+    rows = max(1, chunk_cells // max(m, 1))
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        a = np.sin((phi2 - phi1[start:stop]) / 2) ** 2
+        a += cos1[start:stop] * cos2 * np.sin((lam2 - lam1[start:stop]) / 2) ** 2
+        km[start:stop] = (2 * R) * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    miles = km * 0.621371
+    return miles, km
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    # Interleaves longitude and latitude bisection bits, 5 bits per base32 character
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        span, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (span[0] + span[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+def geohash_cell_size(precision: int) -> tuple[float, float]:
+    # (lat degrees, lon degrees) covered by one cell; longitude gets the extra bit on odd totals
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+def geohash_cover(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                  max_cells: int = 16, max_precision: int = GEOHASH_PRECISION) -> list[str]:
+    """Geohash prefixes whose cells together cover the box, at the finest precision that needs
+    at most `max_cells` cells. A box with min_lon > max_lon crosses the antimeridian."""
+    if min_lon > max_lon:
+        return sorted(set(geohash_cover(min_lat, min_lon, max_lat, 180.0, max_cells, max_precision))
+                      | set(geohash_cover(min_lat, -180.0, max_lat, max_lon, max_cells, max_precision)))
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    for precision in range(max_precision, 0, -1):
+        lat_step, lon_step = geohash_cell_size(precision)
+        rows = range(int((min_lat + 90) // lat_step), int(min((max_lat + 90) // lat_step, 180 / lat_step - 1)) + 1)
+        cols = range(int((min_lon + 180) // lon_step), int(min((max_lon + 180) // lon_step, 360 / lon_step - 1)) + 1)
+        if len(rows) * len(cols) <= max_cells or precision == 1:
+            break
+    # Encode each intersecting cell by its center, which always lies inside the cell
+    return sorted({
+        geohash_encode((row + 0.5) * lat_step - 90, (col + 0.5) * lon_step - 180, precision)
+        for row in rows for col in cols
+    })
+
+def query_coordinates(src: tuple[float, float], dst: tuple[float, float]) -> dict:
+    # Query columns recording both resolved endpoints
+    return {
+        "src_lat": src[0], "src_lon": src[1], "src_geohash": geohash_encode(*src),
+        "dst_lat": dst[0], "dst_lon": dst[1], "dst_geohash": geohash_encode(*dst),
+    }
+
+def radius_bbox(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
+    # Box around a circle; near the poles (or for huge radii) it spans every longitude
+    dlat = math.degrees(radius_km / 6371)
+    cos_lat = math.cos(math.radians(lat))
+    if lat + dlat >= 90 or lat - dlat <= -90 or cos_lat < 1e-9:
+        return max(lat - dlat, -90.0), -180.0, min(lat + dlat, 90.0), 180.0
+    # The circle's widest point is poleward of its center: half-width asin(sin(r/R) / cos(lat))
+    ratio = math.sin(radius_km / 6371) / cos_lat
+    if ratio >= 1:
+        return lat - dlat, -180.0, lat + dlat, 180.0
+    dlon = math.degrees(math.asin(ratio))
+    min_lon = (lon - dlon + 540) % 360 - 180
+    max_lon = (lon + dlon + 540) % 360 - 180
+    return lat - dlat, min_lon, lat + dlat, max_lon
+
 # TODO: Implement geocoding and haversine formula 
\ No newline at end of file
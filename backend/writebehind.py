@@ -0,0 +1,181 @@
+# writebehind.py
+# Write-behind persistence of distance queries: rows are queued and bulk-inserted by a background task
+
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import insert
+
+from models import Query
+from config import (
+    WRITE_BEHIND_QUEUE_SIZE,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_PUT_TIMEOUT,
+    WRITE_BEHIND_DRAIN_TIMEOUT,
+    WRITE_BEHIND_MAX_RETRIES,
+    WRITE_BEHIND_RETRY_DELAY,
+    WRITE_BEHIND_RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger("farfetchr.writebehind")
+
+# Queued by stop(); tells the worker to flush what it has and exit
+_STOP = object()
+
+class QueueFullError(Exception):
+    """Raised when a row could not be queued within the put timeout (backpressure)."""
+
+class QueryWriter:
+    """Bounded queue of Query rows flushed in bulk inserts by size or time threshold."""
+
+    def __init__(self, session_factory, max_queue: int = WRITE_BEHIND_QUEUE_SIZE,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE, flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 put_timeout: float = WRITE_BEHIND_PUT_TIMEOUT, max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+                 retry_delay: float = WRITE_BEHIND_RETRY_DELAY, retry_max_delay: float = WRITE_BEHIND_RETRY_MAX_DELAY):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._max_queue = max_queue
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # Set by stop(): cuts any retry backoff short
+        self._stopping = asyncio.Event()
+        # Rows taken off the queue but not yet written
+        self._pending = 0
+        self.queued = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.retries = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, row: dict):
+        """Queue a Query row (column -> value); waits up to put_timeout for space."""
+        if self._closing:
+            raise QueueFullError("Query writer is shutting down")
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(row), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise QueueFullError(f"Write-behind queue full ({self._max_queue} rows)")
+        self.queued += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._pending = len(batch)
+            await self._flush(batch)
+            self._pending = 0
+            if stopping:
+                return
+
+    async def _flush(self, batch: list):
+        # Callers already got their response, so a failing DB (SQLAlchemy or driver errors such
+        # as ConnectionRefusedError) is retried with backoff; the worker itself never dies here
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(Query), batch)
+                    await db.commit()
+            except Exception as e:
+                # No backoff while stopping: the drain timeout would cancel us mid-sleep
+                if attempt == self.max_retries or self._stopping.is_set():
+                    self.failed += len(batch)
+                    logger.error(f"Write-behind flush of {len(batch)} rows failed after {attempt + 1} attempts: {e!r}")
+                    return
+                self.retries += 1
+                delay = min(self.retry_delay * 2 ** attempt, self.retry_max_delay)
+                logger.warning(f"Write-behind flush of {len(batch)} rows failed, retrying in {delay:.1f}s: {e!r}")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                self.written += len(batch)
+                self.flushes += 1
+                return
+
+    async def stop(self, timeout: float = WRITE_BEHIND_DRAIN_TIMEOUT):
+        """Stop accepting rows, flush everything already queued and wait for the worker."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._stopping.set()
+        try:
+            # The worker keeps draining, so the sentinel gets a slot behind the queued rows
+            await asyncio.wait_for(self._queue.put(_STOP), timeout)
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            dropped = self._pending
+            while not self._queue.empty():
+                if self._queue.get_nowait() is not _STOP:
+                    dropped += 1
+            self.failed += dropped
+            logger.error(f"Write-behind drain timed out; {dropped} rows dropped")
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self._max_queue,
+            "queued": self.queued,
+            "written": self.written,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "retries": self.retries,
+        }
+
+_writer: Optional[QueryWriter] = None
+
+def start_query_writer(session_factory) -> QueryWriter:
+    global _writer
+    if _writer is None:
+        _writer = QueryWriter(session_factory)
+        _writer.start()
+    return _writer
+
+async def stop_query_writer():
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+def get_query_writer() -> Optional[QueryWriter]:
+    return _writer
@@ -18,10 +18,30 @@ export async function calculateDistance(source, destination) {
   return await res.json();
 }
 
-export async function getHistory() {
-  const res = await fetch(`${API_URL}/history`);
+// Filters: address | source | destination (substring), min_miles, max_miles, start, end,
+// limit, cursor (next_cursor from the previous page). Empty values are omitted.
+export async function getHistory(params = {}) {
+  const query = new URLSearchParams();
+  for (const [key, value] of Object.entries(params)) {
+    if (value !== undefined && value !== null && value !== '') query.set(key, String(value));
+  }
+  const qs = query.toString();
+  const res = await fetch(`${API_URL}/history${qs ? `?${qs}` : ''}`);
   if (!res.ok) {
     throw new Error('Failed to fetch history');
   }
   return await res.json();
-} 
\ No newline at end of file
+} 
+// Suggestions from addresses the backend has already resolved; never geocodes.
+// Returns [] on any failure so the form keeps working without it.
+export async function getAutocomplete(q, { limit = 8, signal } = {}) {
+  const query = new URLSearchParams({ q, limit: String(limit) });
+  try {
+    const res = await fetch(`${API_URL}/autocomplete?${query}`, { signal });
+    if (!res.ok) return [];
+    const data = await res.json();
+    return data.suggestions.map((s) => s.address);
+  } catch {
+    return [];
+  }
+}